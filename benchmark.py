@@ -0,0 +1,138 @@
+import numpy as np
+import json
+import os
+import platform
+import subprocess
+import time
+from rof import (Reservoir, WaterBalance, rof_table, simulate_policy, calc_ssi6,
+                 drought_events, set_backend, n_weeks)
+from rof.kernels import HAVE_NUMBA
+from rof.synthetic import (synthetic_demand, synthetic_inflows, synthetic_evap,
+                           synthetic_ssi6, synthetic_rof_tables)
+
+# Times the ROF table generation, the alpha sweep of tradeoff.py and the SSI6 and
+# drought detection of storage_dynamics.py on seeded synthetic inputs at several
+# scales, and appends the results as one JSON line per run to benchmark_results.jsonl.
+
+# Times a call, keeping the fastest of several repeats
+# @param f The function to time
+# @param repeat The number of repeats
+# @returns the fastest time in seconds
+
+def time_call(f, repeat):
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Gets the commit of the code being benchmarked
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+# Times the ROF tables of N_reals realizations (one process)
+def bench_rof_tables(scale, repeat, adaptive=False):
+    N_reals, n_years, n_tiers, N_rofs = (scale["N_reals"], scale["n_years"],
+                                         scale["n_tiers"], scale["N_rofs"])
+    demand = synthetic_demand(N_reals, n_years)
+    evap_timeseries = synthetic_evap(1)[0]
+    inflow_timeseries = synthetic_inflows(1)[0]
+    tiers = np.linspace(0.0, 1.0, n_tiers)
+    reservoir = Reservoir()
+    # the first call compiles the jit backend
+    rof_table(demand[0, :2*n_weeks], evap_timeseries, inflow_timeseries, tiers, reservoir, 2,
+              adaptive=adaptive)
+    seconds = time_call(lambda: [rof_table(demand[r], evap_timeseries, inflow_timeseries, tiers,
+                                           reservoir, N_rofs, adaptive=adaptive)
+                                 for r in range(N_reals)], repeat)
+    return {"seconds": seconds, "per_realization": seconds/N_reals}
+
+# Times the single-pass alpha sweep of tradeoff.py
+def bench_policy(scale, repeat):
+    N_reals, n_years, n_tiers = scale["N_reals"], scale["n_years"], scale["n_tiers"]
+    water_balance = WaterBalance(synthetic_evap(N_reals), synthetic_inflows(N_reals),
+                                 synthetic_demand(N_reals, n_years))
+    rof_tables = synthetic_rof_tables(N_reals, (n_years-1)*n_weeks, n_tiers)
+    alphas = np.linspace(0.0, 0.2, scale["N_alphas"])
+    reservoir = Reservoir()
+    simulate_policy(water_balance, rof_tables[:1], alphas[:1], 1.0, reservoir)
+    seconds = time_call(lambda: simulate_policy(water_balance, rof_tables, alphas, 1.0,
+                                                reservoir), repeat)
+    return {"seconds": seconds, "per_alpha": seconds/len(alphas)}
+
+# Times the SSI6 drought detection of storage_dynamics.py on every realization
+def bench_droughts(scale, repeat):
+    N_reals, n_years = scale["N_reals"], scale["n_years"]
+    ssi6 = synthetic_ssi6(N_reals, (n_years-1)*n_weeks)
+    seconds = time_call(lambda: drought_events(ssi6), repeat)
+    return {"seconds": seconds, "per_realization": seconds/N_reals}
+
+# Times the SSI6 of every realization's policy period inflows
+def bench_ssi6(scale, repeat):
+    N_reals, n_years = scale["N_reals"], scale["n_years"]
+    inflows = synthetic_inflows(N_reals)[:, :(n_years-1)*n_weeks]
+    seconds = time_call(lambda: calc_ssi6(inflows), repeat)
+    return {"seconds": seconds, "per_realization": seconds/N_reals}
+
+# benchmark cases: name -> (function, uses the backend, scale parameters it
+# depends on). A case is only run at the scales that change its parameters
+cases = {
+    "rof_tables": (bench_rof_tables, True, ("N_reals", "n_years", "n_tiers", "N_rofs")),
+    "rof_adaptive": (lambda scale, repeat: bench_rof_tables(scale, repeat, adaptive=True), True,
+                     ("N_reals", "n_years", "n_tiers", "N_rofs")),
+    "policy": (bench_policy, True, ("N_reals", "n_years", "n_tiers", "N_alphas")),
+    "ssi6": (bench_ssi6, False, ("N_reals", "n_years")),
+    "droughts": (bench_droughts, False, ("N_reals", "n_years")),
+}
+
+def main():
+    # To modify #########################################################
+    scales = {
+        "small": {"N_reals": 5, "n_years": 6, "n_tiers": 11, "N_rofs": 20, "N_alphas": 21},
+        "medium": {"N_reals": 20, "n_years": 26, "n_tiers": 21, "N_rofs": 50, "N_alphas": 21},
+        "fine_alpha": {"N_reals": 20, "n_years": 26, "n_tiers": 21, "N_rofs": 50, "N_alphas": 201},
+    }
+    repeat = 3
+    output_file = "benchmark_results.jsonl"
+    backends = ["numpy", "jit"] if HAVE_NUMBA else ["numpy"]
+
+    results = []
+    measured = set()
+    for scale_name, scale in scales.items():
+        for case, (bench, uses_backend, params) in cases.items():
+            # e.g. fine_alpha only changes the alphas, so only the policy is rerun
+            if (case,) + tuple(scale[p] for p in params) in measured:
+                continue
+            measured.add((case,) + tuple(scale[p] for p in params))
+            for backend in (backends if uses_backend else ["numpy"]):
+                set_backend(backend)
+                record = {"case": case, "scale": scale_name, "backend": backend}
+                record.update(scale)
+                record.update(bench(scale, repeat))
+                print(f"{case:>10} {scale_name:>10} {backend:>6}: {record['seconds']:0.4f} seconds")
+                results.append(record)
+    set_backend("numpy")
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": HAVE_NUMBA,
+        "cpu_count": os.cpu_count(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+    with open(output_file, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    print("results appended to ", output_file)
+
+if __name__ == "__main__":
+    main()
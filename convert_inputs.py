@@ -0,0 +1,13 @@
+import os
+from rof.data_io import convert_inputs
+
+# Converts the water balance CSVs in ./water_balance_files/ into scaled .npy
+# files that every script loads instead of parsing the CSVs
+
+def main():
+    # Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
+    cwd = os.getcwd()
+    convert_inputs(cwd + "/water_balance_files/")
+
+if __name__ == "__main__":
+    main()
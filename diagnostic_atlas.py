@@ -0,0 +1,160 @@
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")   # headless, also in the worker processes
+import matplotlib.pyplot as plt
+import hashlib
+import os
+import time
+from multiprocessing import Pool
+from rof import (Reservoir, WaterBalance, load_dynamics, calc_ssi6, drought_events,
+                 realization_events)
+from rof.cache import is_cached, remove_key, write_key
+from rof.data_io import alpha_label
+from rof.instrument import Progress
+from storage_dynamics import plot_storage_dynamics
+from rof_dynamics import first_restriction_weeks, plot_first_restriction
+from visualize_hydrology import plot_hydrology
+
+# Renders the figures of storage_dynamics.py, rof_dynamics.py and
+# visualize_hydrology.py for many realizations and alphas into one folder.
+# The inputs are loaded and the SSI6, drought events and no-action storage
+# are computed once, in this process, for every realization; the figures are
+# drawn across a process pool with the Agg backend. Each figure is stored
+# next to a key file holding a hash of the data it was drawn from, as the
+# ROF tables are (see rof/cache.py), so re-running the atlas only redraws the
+# figures whose inputs changed.
+
+# Bump when a plot changes so every figure is redrawn
+atlas_version = "atlas-1"
+
+# plot name -> plotting function, called with the arguments of the figure
+plots = {
+    "storage_dynamics": plot_storage_dynamics,
+    "first_restriction": plot_first_restriction,
+    "hydrology": plot_hydrology,
+}
+
+# Calculates the cache key of a figure
+# @param name The plot
+# @param args The arguments of the plotting function
+# @returns the hex digest identifying the figure
+
+def figure_key(name, args):
+    h = hashlib.sha256()
+    h.update(f"{atlas_version}|{name}".encode())
+    for x in args:
+        x = np.asarray(x)
+        if x.dtype.names is not None:   # drought event tables
+            x = np.stack([x[field].astype(float) for field in x.dtype.names])
+        x = np.ascontiguousarray(x, dtype=float)
+        h.update(str(x.shape).encode())
+        h.update(x.tobytes())
+    return h.hexdigest()
+
+# Draws one figure and writes it with its cache key
+# @param task The (plot, file name, cache key, arguments) of the figure
+# @returns the file name
+
+def render_figure(task):
+    name, file_name, key, args = task
+    remove_key(file_name)
+    fig = plots[name](*args)
+    root, ext = os.path.splitext(file_name)
+    fig.savefig(root + ".tmp" + ext)
+    plt.close(fig)
+    os.replace(root + ".tmp" + ext, file_name)
+    write_key(file_name, key)
+    return file_name
+
+# Makes the figure tasks of the atlas, loading every input once
+# @param cwd The folder holding water_balance_files/ and dynamics/
+# @param realizations The realizations to plot
+# @param tier The initial storage as a fraction of full capacity
+# @param alphas The ROF triggers to plot
+# @param figure_path The folder of the figures
+# @param fmt The image format, e.g. "png"
+# @returns the list of tasks for render_figure
+
+def atlas_tasks(cwd, realizations, tier, alphas, figure_path, fmt="png"):
+    dynamics_path = cwd + "/dynamics/"
+    realizations = np.asarray(realizations)
+    water_balance = WaterBalance.load(cwd + "/water_balance_files/")
+    reservoir = Reservoir()
+    demand_r, inflow_r = (np.array(x) for x in water_balance.policy_inputs(realizations)[:2])
+
+    # inputs shared by the figures of a realization
+    ssi6 = calc_ssi6(inflow_r)
+    events = drought_events(ssi6)
+    storage = water_balance.baseline_storage(reservoir, reservoir.capacity*0.4, realizations)
+    first_weeks = first_restriction_weeks(dynamics_path, tier, alphas, realizations)
+
+    tasks = []
+    def add(name, file_name, args):
+        file_name = os.path.join(figure_path, file_name + "." + fmt)
+        tasks.append((name, file_name, figure_key(name, args), args))
+
+    for i, r in enumerate(realizations):
+        add("hydrology", f"hydrology_r{r}", (inflow_r[i], demand_r[i], storage[i]))
+        add("first_restriction", f"first_restriction_r{r}", (first_weeks[i], alphas, inflow_r[i]))
+    for alpha in alphas:
+        # the dynamics are memory-mapped, so only the rows plotted are read
+        storage_a = load_dynamics(dynamics_path, "str_dynamics", tier, alpha)
+        rf_a = load_dynamics(dynamics_path, "restr_freq", tier, alpha)
+        rof_a = load_dynamics(dynamics_path, "short_term_risk", tier, alpha)
+        for i, r in enumerate(realizations):
+            add("storage_dynamics", f"storage_dynamics_r{r}_" + alpha_label(alpha).replace(".", ""),
+                (storage_a[r]/(10**3), rf_a[r], rof_a[r]*100, ssi6[i],
+                 realization_events(events, i), alpha))
+    return tasks
+
+# Draws the figures that are missing or out of date
+# @param tasks The figure tasks (see atlas_tasks)
+# @param n_workers The number of worker processes; 1 draws in this process
+# @returns the number of figures drawn
+
+def render_atlas(tasks, n_workers=1):
+    stale = [task for task in tasks if not is_cached(task[1], task[2])]
+    print(len(tasks) - len(stale), " of ", len(tasks), " figures are up to date")
+    for task in stale:
+        os.makedirs(os.path.dirname(task[1]), exist_ok=True)
+    progress = Progress(len(stale))
+    if n_workers <= 1:
+        results = map(render_figure, stale)
+        pool = None
+    else:
+        pool = Pool(n_workers)
+        results = pool.imap_unordered(render_figure, stale, chunksize=4)
+    try:
+        for file_name in results:
+            progress.update()
+            if progress.done % 50 == 0 or progress.done == len(stale):
+                print("figures: ", progress)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return len(stale)
+
+def main():
+    start = time.perf_counter()
+
+    # Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
+    # Modify filenames and locations depending on test case ############
+    cwd = os.getcwd()
+
+    # To modify #########################################################
+    realizations = np.arange(0, 10)   # realizations to plot
+    tier = 1.0   # initial storage tier of the dynamics written by tradeoff.py
+    alphas = np.round(np.arange(0.00, 0.21, 0.01), 2)   # ROF triggers to plot
+    N_workers = os.cpu_count()   # Number of worker processes (1 draws serially)
+    figure_path = cwd + "/Figures/atlas/"
+    fmt = "png"
+
+    tasks = atlas_tasks(cwd, realizations, tier, alphas, figure_path, fmt)
+    render_atlas(tasks, N_workers)
+
+    end = time.perf_counter()
+    print(f"Time = {end - start:0.4f} seconds")
+
+if __name__ == "__main__":
+    main()
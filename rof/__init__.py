@@ -0,0 +1,34 @@
+'''Risk-of-failure (ROF) simulation core shared by the scripts of this repo
+
+reservoir    - the Reservoir and WaterBalance model and the batched step function
+engine       - batched (and reference scalar) ROF table generation
+parallel     - ROF table generation across a process pool
+cache        - input-keyed ROF table cache
+tables       - generating and loading the ROF table files of a folder
+policy       - storage tier lookup and the multi-alpha restriction policy simulation
+utilities    - several utilities sharing a reservoir, simulated together
+sweep        - grid and Latin hypercube sweeps over policy variants
+service      - single or batched real-time ROF queries of a storage, week and demand forecast
+data_io      - binary (.npy) inputs and weekly dynamics
+kernels      - optional Numba-compiled loops, selected with set_backend
+restrictions - first week, count and episodes of the restrictions of every realization
+droughts     - SSI6 and its drought events of every realization at once
+synthetic    - seeded synthetic inputs for benchmarks
+instrument   - counters, timers, progress and profiling hooks
+'''
+
+from .reservoir import (Reservoir, WaterBalance, policy_offset, reservoir_capacity,
+                        failure_threshold, n_weeks, utility)
+from .engine import rof_table, rof_table_scalar
+from .parallel import generate_rof_tables
+from .tables import tiers, generate_tables, load_tables
+from .policy import (tier_index, tier_row, lookup_rof, simulate_policy, simulate_policy_chunked,
+                     simulate_restrictions, simulate_realization)
+from .utilities import Utility, simulate_utilities
+from .sweep import grid_scenarios, latin_hypercube_scenarios, run_sweep, save_sweep
+from .service import RofService
+from .data_io import (load_input, load_inputs, save_dynamics, load_dynamics, DynamicsWriter,
+                      load_restriction_index)
+from .kernels import set_backend, get_backend
+from .droughts import calc_ssi6, Ssi6Tracker, drought_events, realization_events
+from .restrictions import restriction_index, realization_episodes
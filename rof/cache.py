@@ -0,0 +1,143 @@
+import numpy as np
+import hashlib
+import os
+from . import instrument
+
+# ROF table cache ###################################################
+# Each ROF table is stored next to a small key file holding a hash of every
+# input that determines it: the demand row, the slice of the historical
+# hydrology that the ROF simulations read, the reservoir capacity, the
+# failure threshold, the storage tiers and the number of ROF simulations.
+# A table whose key file matches the current inputs is reused, so a run that
+# is interrupted picks up where it stopped, and a change in any input only
+# regenerates the tables it affects.
+
+# Bump when the ROF table computation changes so old tables are regenerated
+cache_version = "rof_table-1"
+
+# Calculates the cache key of the ROF table of one realization
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @returns the hex digest identifying the table
+
+def rof_table_key(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                  reservoir, n_hist_years, n_weeks):
+    # the ROF simulations never read past this week of the hydrology
+    n_hist = n_hist_years*n_weeks + len(demand_r) - n_weeks
+    h = hashlib.sha256()
+    h.update(f"{cache_version}|{float(reservoir.capacity)!r}|{float(reservoir.threshold)!r}|"
+             f"{int(n_hist_years)}|{int(n_weeks)}".encode())
+    for x in (tiers, demand_r, evap_timeseries[:n_hist], inflow_timeseries[:n_hist]):
+        x = np.ascontiguousarray(x, dtype=float)
+        h.update(str(x.shape).encode())
+        h.update(x.tobytes())
+    return h.hexdigest()
+
+# Gets the file name of the ROF table of a realization
+# @param path The folder in which the ROF tables are stored
+# @param utility The name of the utility
+# @param r The realization
+# @returns the file name of the ROF table
+
+def rof_table_file(path, utility, r):
+    return os.path.join(path, utility + "_rof_table_r" + str(r) + ".csv")
+
+# Gets the ROF table files of the first n_reals realizations, in order
+# @param path The folder in which the ROF tables are stored
+# @param utility The name of the utility
+# @param n_reals The number of realizations
+# @returns the list of file names, indexed by realization
+
+def rof_table_files(path, utility, n_reals):
+    files = [rof_table_file(path, utility, r) for r in range(n_reals)]
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        raise FileNotFoundError(f"{len(missing)} ROF table(s) missing, e.g. {missing[0]}; "
+                                "run rof_table_generator.py first")
+    return files
+
+# Gets the file name of the stacked (realizations x tiers x weeks) ROF tables
+# @param path The folder in which the ROF tables are stored
+# @param utility The name of the utility
+# @returns the file name of the stacked tables
+
+def stacked_tables_file(path, utility):
+    return os.path.join(path, utility + "_rof_tables.npy")
+
+# Gets the stamps of the ROF table files that a stack was built from: the
+# cache version, name, size and modification time of every table
+# @param files The ROF table files, indexed by realization
+# @returns one stamp per table
+
+def table_stamps(files):
+    stamps = []
+    for f in files:
+        stat = os.stat(f)
+        stamps.append(f"{cache_version}|{os.path.basename(f)}|{stat.st_size}|{stat.st_mtime_ns}")
+    return stamps
+
+# Checks if the stacked ROF tables hold the current version of every table
+# A stack of more realizations also covers fewer realizations
+# @param file_name The file name of the stacked tables
+# @param stamps The stamps of the current table files
+# @returns True if the stack can be used, False otherwise
+
+def stack_covers(file_name, stamps):
+    if not os.path.exists(file_name):
+        return False
+    try:
+        with open(file_name + ".key") as f:
+            stored = f.read().split()
+    except OSError:
+        return False
+    return stored[:len(stamps)] == stamps
+
+# Checks if the stored ROF table was generated from the current inputs
+# @param file_name The file name of the ROF table
+# @param key The cache key of the current inputs
+# @returns True if the table can be reused, False otherwise
+
+def is_cached(file_name, key):
+    if not os.path.exists(file_name):
+        return False
+    try:
+        with open(file_name + ".key") as f:
+            return f.read().strip() == key
+    except OSError:
+        return False
+
+# Writes a ROF table and its cache key
+# Both are written to temporary files first and moved into place, the key
+# last, so that a crash never leaves a partial table marked as valid
+# @param file_name The file name of the ROF table
+# @param rof_table_r The ROF table
+# @param key The cache key of the inputs the table was generated from
+
+@instrument.timed("write_rof_table")
+def save_rof_table(file_name, rof_table_r, key):
+    remove_key(file_name)
+    np.savetxt(file_name + ".tmp", rof_table_r, delimiter=",")
+    os.replace(file_name + ".tmp", file_name)
+    write_key(file_name, key)
+
+# Removes the cache key of a file, marking it as out of date
+# @param file_name The cached file
+
+def remove_key(file_name):
+    if os.path.exists(file_name + ".key"):
+        os.remove(file_name + ".key")
+
+# Writes the cache key of a file that has been completely written
+# @param file_name The cached file
+# @param key The cache key of the file
+
+def write_key(file_name, key):
+    key_file = file_name + ".key"
+    with open(key_file + ".tmp", "w") as f:
+        f.write(key + "\n")
+    os.replace(key_file + ".tmp", key_file)
@@ -0,0 +1,366 @@
+import numpy as np
+import json
+import os
+from . import instrument
+
+# Binary inputs and outputs #########################################
+# Parsing the multi-megabyte water balance CSVs with np.loadtxt dominates the
+# start-up of every script, and tradeoff.py writes (and the plotting scripts
+# read back) four CSVs per alpha. convert_inputs turns the CSVs into .npy
+# files once, already scaled, and records the scaling factors and the source
+# file they came from in water_balance.json. The .npy files are memory-mapped
+# when loaded, so only the parts that are used are read from disk.
+#
+# Run convert_inputs.py to convert the inputs in ./water_balance_files/
+
+# Water balance inputs: name -> (CSV file, scaling factor)
+input_files = {
+    "evap": ("jordan_lake_evap.csv", 2),
+    "inflows": ("jordan_lake_inflows.csv", 0.20),
+    "demand": ("cary_demand.csv", 1.1),
+}
+metadata_file = "water_balance.json"
+
+# Weekly dynamics written by tradeoff.py: kind -> (folder, file prefix)
+dynamics_files = {
+    "restr_freq": ("restr_freq", "restr_freq_"),
+    "restr_demand": ("restr_demand", "restr_demand_"),
+    "str_dynamics": ("str_dynamics", "str_dynamics_"),
+    "short_term_risk": ("short_term_risk", "risk_"),
+}
+
+# Gets the size and modification time that identify a source CSV
+def _source_stamp(file_name):
+    stat = os.stat(file_name)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Reads the conversion metadata of a folder
+# @param path The folder of the water balance files
+# @returns the metadata, or an empty dict if the inputs were never converted
+
+def read_metadata(path):
+    try:
+        with open(os.path.join(path, metadata_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Converts the water balance CSVs into scaled .npy files
+# @param path The folder of the water balance files
+# @param names The inputs to convert; all that exist by default
+# @returns the metadata of the converted inputs
+
+def convert_inputs(path, names=None):
+    metadata = read_metadata(path)
+    for name in (names or input_files):
+        csv_file, scale = input_files[name]
+        csv_path = os.path.join(path, csv_file)
+        if not os.path.exists(csv_path):
+            continue
+        data = scale*np.loadtxt(csv_path, delimiter=",")
+        np.save(os.path.join(path, name + ".npy"), data)
+        metadata[name] = {"file": name + ".npy", "source": csv_file, "scale": scale,
+                          "shape": list(data.shape), "source_stamp": _source_stamp(csv_path)}
+        print("converted ", csv_file, " -> ", name + ".npy")
+    with open(os.path.join(path, metadata_file), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+# Loads one scaled water balance input
+# The .npy file is used if it was converted with the current scaling factor
+# and its source CSV (if still present) has not changed since; otherwise the
+# CSV is parsed
+# @param path The folder of the water balance files
+# @param name The input to load ("evap", "inflows" or "demand")
+# @param mmap If True, memory-map the .npy file instead of reading it
+# @returns the scaled (realizations x weeks) array
+
+@instrument.timed("load_input")
+def load_input(path, name, mmap=True):
+    csv_file, scale = input_files[name]
+    csv_path = os.path.join(path, csv_file)
+    entry = read_metadata(path).get(name)
+    if entry is not None and entry["scale"] == scale:
+        npy_path = os.path.join(path, entry["file"])
+        fresh = not os.path.exists(csv_path) or _source_stamp(csv_path) == entry["source_stamp"]
+        if fresh and os.path.exists(npy_path):
+            return np.load(npy_path, mmap_mode="r" if mmap else None)
+    return scale*np.loadtxt(csv_path, delimiter=",")
+
+# Loads the scaled evaporation, inflows and demand
+# @param path The folder of the water balance files
+# @param mmap If True, memory-map the .npy files instead of reading them
+# @returns the evaporation, inflow and demand arrays
+
+def load_inputs(path, mmap=True):
+    return tuple(load_input(path, name, mmap) for name in ("evap", "inflows", "demand"))
+
+# Compact weekly dynamics: kind -> (encoding, scale). Restriction flags are
+# bit-packed along the weeks (8 weeks per byte), the ROF, which lies in
+# [0, 1], is quantized to uint16 and storage and demand are kept as float32.
+# The encoding, scale and decoded shape of every compact file are recorded in
+# dynamics.json in the dynamics folder, and load_dynamics decodes them.
+compact_encodings = {
+    "restr_freq": ("bits", 1),
+    "restr_demand": ("float32", 1),
+    "str_dynamics": ("float32", 1),
+    "short_term_risk": ("uint16", 1/65535),
+}
+dynamics_metadata_file = "dynamics.json"
+dynamics_formats = {"npy": ".npy", "csv": ".csv", "compact": ".compact.npy"}
+
+# Gets the label of an alpha in the dynamics file names: two decimals, as
+# tradeoff.py has always named them, or as many digits as a finer alpha needs
+# @param alpha The ROF trigger
+# @returns the label
+
+def alpha_label(alpha):
+    label = f"{alpha:.2f}"
+    if abs(float(label) - alpha) > 1e-9:
+        label = f"{alpha:.6g}"
+    return label
+
+# Gets the file name of the weekly dynamics of one tier and alpha
+# @param path The dynamics folder
+# @param kind The kind of dynamics (see dynamics_files)
+# @param tier The initial storage as a fraction of full capacity
+# @param alpha The ROF trigger
+# @param ext The file extension, ".csv", ".npy" or ".compact.npy"
+# @returns the file name
+
+def dynamics_file(path, kind, tier, alpha, ext):
+    folder, prefix = dynamics_files[kind]
+    return os.path.join(path, folder, prefix + str(tier) + "_" + alpha_label(alpha) + ext)
+
+# Reads the metadata of the compact dynamics of a folder
+# @param path The dynamics folder
+# @returns file name (relative to the folder) -> encoding, scale and shape
+
+def read_dynamics_metadata(path):
+    try:
+        with open(os.path.join(path, dynamics_metadata_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+# Records the encoding of compact dynamics files in the folder's metadata
+# @param path The dynamics folder
+# @param entries file name -> encoding, scale and shape
+
+def _update_dynamics_metadata(path, entries):
+    metadata = read_dynamics_metadata(path)
+    metadata.update(entries)
+    with open(os.path.join(path, dynamics_metadata_file) + ".tmp", "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(os.path.join(path, dynamics_metadata_file) + ".tmp",
+               os.path.join(path, dynamics_metadata_file))
+
+# Gets the stored shape of a kind of dynamics in a format
+# @param kind The kind of dynamics
+# @param shape The (realizations x weeks) shape of the dynamics
+# @param fmt The output format
+# @returns the shape and dtype stored, or None for the dtype of the data
+
+def _stored_layout(kind, shape, fmt):
+    if fmt != "compact":
+        return shape, None
+    encoding, _ = compact_encodings[kind]
+    if encoding == "bits":
+        return (shape[0], (shape[1] + 7)//8), np.uint8
+    return shape, np.dtype(encoding)
+
+# Encodes a block of dynamics for the compact format
+# @param kind The kind of dynamics
+# @param data The (realizations x weeks) dynamics
+# @returns the encoded block
+
+def encode_dynamics(kind, data):
+    encoding, scale = compact_encodings[kind]
+    if encoding == "bits":
+        return np.packbits(np.asarray(data) != 0, axis=1)
+    if encoding == "uint16":
+        return np.round(np.clip(data, 0.0, 65535*scale)/scale).astype(np.uint16)
+    return np.asarray(data, dtype=encoding)
+
+# Decodes a block of compact dynamics
+# @param entry The metadata of the file (encoding, scale, shape)
+# @param data The encoded (realizations x ...) block
+# @returns the (realizations x weeks) dynamics
+
+def decode_dynamics(entry, data):
+    if entry["encoding"] == "bits":
+        return np.unpackbits(data, axis=-1, count=entry["shape"][1]).astype(int)
+    if entry["encoding"] == "uint16":
+        return data*entry["scale"]
+    return data.astype(float)
+
+# Removes the files of the other formats of the same dynamics, so that
+# load_dynamics never reads an older run
+def _remove_other_formats(path, kind, tier, alpha, fmt):
+    for other, ext in dynamics_formats.items():
+        file_name = dynamics_file(path, kind, tier, alpha, ext)
+        if other != fmt and os.path.exists(file_name):
+            os.remove(file_name)
+
+# Writes the weekly dynamics of one tier and alpha
+# @param path The dynamics folder
+# @param kind The kind of dynamics (see dynamics_files)
+# @param tier The initial storage as a fraction of full capacity
+# @param alpha The ROF trigger
+# @param data The (realizations x weeks) dynamics
+# @param fmt The output format, "csv", "npy" or "compact"
+
+@instrument.timed("write_dynamics")
+def save_dynamics(path, kind, tier, alpha, data, fmt="npy"):
+    file_name = dynamics_file(path, kind, tier, alpha, dynamics_formats[fmt])
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    _remove_other_formats(path, kind, tier, alpha, fmt)
+    if fmt == "npy":
+        np.save(file_name, data)
+    elif fmt == "compact":
+        np.save(file_name, encode_dynamics(kind, data))
+        encoding, scale = compact_encodings[kind]
+        _update_dynamics_metadata(path, {os.path.relpath(file_name, path): {
+            "encoding": encoding, "scale": scale, "shape": list(np.shape(data))}})
+    else:
+        np.savetxt(file_name, data, delimiter=",")
+
+class DynamicsWriter:
+    '''Writes the weekly dynamics of every alpha one block of realizations at a time
+
+    The .npy files (full or compact) are created at their full size up front
+    and memory-mapped, so only the block being written is held in memory;
+    .csv files are appended to, so blocks must be written in order of
+    realization.
+    '''
+
+    kinds = ("restr_freq", "restr_demand", "str_dynamics", "short_term_risk")
+
+    def __init__(self, path, tier, alphas, N_reals, n_policy_weeks, fmt="npy"):
+        if fmt not in dynamics_formats:
+            raise ValueError(f"unknown output format {fmt!r}, expected one of "
+                             f"{tuple(dynamics_formats)}")
+        self.path = path
+        self.tier = tier
+        self.alphas = list(alphas)
+        labels = [alpha_label(alpha) for alpha in self.alphas]
+        if len(set(labels)) < len(labels):
+            repeated = sorted({label for label in labels if labels.count(label) > 1})
+            raise ValueError(f"alphas {repeated} would be written to the same files")
+        self.shape = (N_reals, n_policy_weeks)
+        self.fmt = fmt
+        self.next_row = 0
+        self.files = {}
+        self.metadata = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # Gets the open file of one kind and alpha, creating it on first use
+    def _file(self, kind, a, dtype):
+        if (kind, a) not in self.files:
+            alpha = self.alphas[a]
+            file_name = dynamics_file(self.path, kind, self.tier, alpha, dynamics_formats[self.fmt])
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            _remove_other_formats(self.path, kind, self.tier, alpha, self.fmt)
+            if self.fmt == "csv":
+                self.files[kind, a] = open(file_name, "w")
+            else:
+                shape, stored_dtype = _stored_layout(kind, self.shape, self.fmt)
+                self.files[kind, a] = np.lib.format.open_memmap(
+                    file_name, mode="w+", dtype=stored_dtype or dtype, shape=shape)
+            if self.fmt == "compact":
+                encoding, scale = compact_encodings[kind]
+                self.metadata[os.path.relpath(file_name, self.path)] = {
+                    "encoding": encoding, "scale": scale, "shape": list(self.shape)}
+        return self.files[kind, a]
+
+    # Writes the dynamics of a block of realizations
+    # @param r0 The first realization of the block
+    # @param dynamics The (alphas x realizations x weeks) restriction frequency,
+    #        restricted demand, storage and short-term risk of the block
+
+    @instrument.timed("write_dynamics")
+    def write(self, r0, *dynamics):
+        if self.fmt == "csv" and r0 != self.next_row:
+            raise ValueError(f"blocks must be written in order, expected realization "
+                             f"{self.next_row} but got {r0}")
+        for kind, data in zip(self.kinds, dynamics):
+            for a in range(len(self.alphas)):
+                out = self._file(kind, a, data.dtype)
+                if self.fmt == "csv":
+                    np.savetxt(out, data[a], delimiter=",")
+                elif self.fmt == "compact":
+                    out[r0:r0+data.shape[1]] = encode_dynamics(kind, data[a])
+                else:
+                    out[r0:r0+data.shape[1]] = data[a]
+        self.next_row = r0 + dynamics[0].shape[1]
+
+    # Flushes and closes every file and records the encoding of compact files
+    def close(self):
+        for out in self.files.values():
+            if self.fmt == "csv":
+                out.close()
+            else:
+                out.flush()
+        self.files = {}
+        if self.metadata:
+            _update_dynamics_metadata(self.path, self.metadata)
+            self.metadata = {}
+
+# Loads the weekly dynamics of one tier and alpha in whichever format they
+# were written, decoding compact files
+# @param path The dynamics folder
+# @param kind The kind of dynamics (see dynamics_files)
+# @param tier The initial storage as a fraction of full capacity
+# @param alpha The ROF trigger
+# @param r The realization to load; all by default. Only that realization is
+#        read from .npy files
+# @returns the (realizations x weeks) dynamics, or the weekly dynamics of r
+
+def load_dynamics(path, kind, tier, alpha, r=None):
+    rows = slice(None) if r is None else r
+    compact_file = dynamics_file(path, kind, tier, alpha, dynamics_formats["compact"])
+    if os.path.exists(compact_file):
+        entry = read_dynamics_metadata(path)[os.path.relpath(compact_file, path)]
+        return decode_dynamics(entry, np.load(compact_file, mmap_mode="r")[rows])
+    npy_file = dynamics_file(path, kind, tier, alpha, ".npy")
+    if os.path.exists(npy_file):
+        return np.load(npy_file, mmap_mode="r")[rows]
+    return np.loadtxt(dynamics_file(path, kind, tier, alpha, ".csv"), delimiter=",")[rows]
+
+# Gets the file name of the restriction index of one tier
+# @param path The dynamics folder
+# @param tier The initial storage as a fraction of full capacity
+# @returns the file name
+
+def restriction_index_file(path, tier):
+    return os.path.join(path, "restriction_index_" + str(tier) + ".npz")
+
+# Writes the restriction index of one tier (see rof.restrictions)
+# @param path The dynamics folder
+# @param tier The initial storage as a fraction of full capacity
+# @param alphas The ROF triggers
+# @param first_week The (realizations x alphas) first week of restriction
+# @param count The (realizations x alphas) number of restrictions
+# @param episodes The episode table
+
+@instrument.timed("write_dynamics")
+def save_restriction_index(path, tier, alphas, first_week, count, episodes):
+    os.makedirs(path, exist_ok=True)
+    np.savez(restriction_index_file(path, tier), alphas=np.asarray(alphas, dtype=float),
+             first_week=first_week, count=count, episodes=episodes)
+
+# Loads the restriction index of one tier written by tradeoff.py
+# @param path The dynamics folder
+# @param tier The initial storage as a fraction of full capacity
+# @returns the alphas, the (realizations x alphas) first week of restriction
+#          (-1 if there is none) and number of restrictions, and the episode table
+
+def load_restriction_index(path, tier):
+    with np.load(restriction_index_file(path, tier)) as index:
+        return index["alphas"], index["first_week"], index["count"], index["episodes"]
@@ -0,0 +1,205 @@
+import numpy as np
+
+# SSI6 ##############################################################
+# The SSI6 of a realization is the 24-week rolling mean of its standardized
+# log inflows: the log inflows are forward-filled over missing values (the log
+# of a negative inflow), standardized with their mean and standard deviation
+# and averaged over the last 24 weeks (or fewer at the start), and the rolling
+# means are forward-filled again. This is what storage_dynamics.py used to do
+# for one realization through pandas (fillna(method='pad'), rolling(24,
+# min_periods=1).mean()); here the whole (realizations x weeks) inflow matrix
+# is handled at once, the rolling means come from cumulative sums and the
+# forward fills from a running maximum of the index of the last valid week.
+#
+# Because the rolling mean of the standardized log inflows is the
+# standardized rolling mean of the log inflows, Ssi6Tracker only keeps the
+# running moments and the rolling means of the log inflows, and updates them
+# as new weeks of inflows arrive without recomputing the past weeks.
+
+ssi6_weeks = 24
+
+# Forward-fills the missing values of each row
+# Values before the first valid value of a row stay missing
+# @param x The (realizations x weeks) values, NaN where missing
+# @returns the filled values
+
+def forward_fill(x):
+    x = np.asarray(x, dtype=float)
+    last_valid = np.where(np.isnan(x), 0, np.arange(x.shape[-1]))
+    np.maximum.accumulate(last_valid, axis=-1, out=last_valid)
+    return np.take_along_axis(x, last_valid, axis=-1)
+
+# Calculates the rolling mean of each row over the valid values of the last
+# window weeks, as pandas rolling(window, min_periods=1).mean()
+# @param x The (realizations x weeks) values, NaN where missing
+# @param window The number of weeks of the rolling window
+# @returns the (realizations x weeks) rolling means, NaN where a window has
+#          no valid value
+
+def rolling_mean(x, window):
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    valid = ~np.isnan(x)
+    sums = np.zeros((x.shape[0], x.shape[1] + 1))
+    counts = np.zeros((x.shape[0], x.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.where(valid, x, 0.0), axis=1, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+    end = np.arange(1, x.shape[1] + 1)
+    start = np.maximum(end - window, 0)
+    n = counts[:, end] - counts[:, start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (sums[:, end] - sums[:, start])/n, np.nan)
+
+# Calculates the SSI6 of one or more realizations
+# @param inflows The inflows, one realization or (realizations x weeks)
+# @param window The number of weeks of the rolling mean
+# @returns the SSI6 timeseries, with the shape of the inflows
+
+def calc_ssi6(inflows, window=ssi6_weeks):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_inflows = forward_fill(np.log(np.atleast_2d(np.asarray(inflows, dtype=float))))
+        mu = np.nanmean(log_inflows, axis=1, keepdims=True)
+        sigma = np.nanstd(log_inflows, axis=1, ddof=1, keepdims=True)
+    out = forward_fill(rolling_mean((log_inflows - mu)/sigma, window))
+    return out[0] if np.ndim(inflows) == 1 else out
+
+class Ssi6Tracker:
+    '''Keeps the SSI6 of every realization up to date as weekly inflows arrive
+
+    Each update costs the weeks added, not the weeks seen so far: the moments
+    of the log inflows are combined with those of the new weeks and only the
+    rolling means of the new weeks are computed. The SSI6 agrees with calc_ssi6 on
+    all the inflows seen, to rounding.
+    '''
+
+    def __init__(self, N_reals, window=ssi6_weeks):
+        self.window = window
+        self.last = np.full(N_reals, np.nan)       # last log inflow, carried by the forward fill
+        self.tail = np.full((N_reals, 0), np.nan)  # log inflows of the last window-1 weeks
+        self.n = np.zeros(N_reals, dtype=np.int64) # running count, mean and sum of squared
+        self.mean = np.zeros(N_reals)              # deviations of the valid log inflows
+        self.m2 = np.zeros(N_reals)
+        self.last_mean = np.full(N_reals, np.nan)  # last rolling mean, carried by the forward fill
+        self.means = []                            # rolling means of the log inflows, in blocks
+
+    @property
+    def n_weeks(self):
+        return sum(m.shape[1] for m in self.means)
+
+    # Adds weeks of inflows
+    # @param inflows The (realizations x new weeks) inflows, or one week
+    #        (realizations) of inflows
+
+    def update(self, inflows):
+        inflows = np.asarray(inflows, dtype=float)
+        if inflows.ndim == 1:
+            inflows = inflows[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x = forward_fill(np.column_stack([self.last, np.log(inflows)]))[:, 1:]
+        self.last = x[:, -1]
+
+        # combine the moments of the new weeks with the running moments
+        valid = ~np.isnan(x)
+        n_new = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_new = np.where(n_new > 0, np.where(valid, x, 0.0).sum(axis=1)/n_new, 0.0)
+            m2_new = np.where(valid, (x - mean_new[:, None])**2, 0.0).sum(axis=1)
+            n = self.n + n_new
+            delta = mean_new - self.mean
+            self.mean = np.where(n > 0, self.mean + delta*n_new/n, 0.0)
+            self.m2 = np.where(n > 0, self.m2 + m2_new + delta**2*self.n*n_new/n, 0.0)
+        self.n = n
+
+        # rolling means of the new weeks, using the log inflows of the last weeks
+        extended = np.column_stack([self.tail, x])
+        means = rolling_mean(extended, self.window)[:, self.tail.shape[1]:]
+        means = forward_fill(np.column_stack([self.last_mean, means]))[:, 1:]
+        self.last_mean = means[:, -1]
+        self.tail = extended[:, extended.shape[1] - min(self.window - 1, extended.shape[1]):]
+        self.means.append(means)
+
+    # Standardizes rolling means of the log inflows with the running moments
+    # @param means The (realizations x weeks) or (realizations) rolling means
+    # @returns the SSI6
+
+    def _standardize(self, means):
+        mu, n, m2 = self.mean, self.n, self.m2
+        if means.ndim == 2:
+            mu, n, m2 = mu[:, None], n[:, None], m2[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (means - mu)/np.sqrt(m2/(n - 1))
+
+    # Gets the SSI6 of every week seen so far
+    # @returns the (realizations x weeks) SSI6
+
+    def values(self):
+        if len(self.means) > 1:
+            self.means = [np.concatenate(self.means, axis=1)]
+        if not self.means:
+            return np.zeros((len(self.n), 0))
+        return self._standardize(self.means[0])
+
+    # Gets the SSI6 of the last week seen
+    # @returns the SSI6 of each realization
+
+    def latest(self):
+        return self._standardize(self.last_mean)
+
+# SSI6 drought events ###############################################
+# A drought is a window of drought_weeks consecutive weeks in which the SSI6
+# never rises above 0 and drops to -1 or below at least once, i.e. the rolling
+# max of the window is <= 0 and its rolling min is <= -1. Both conditions are
+# counted over every window at once with cumulative sums of the weeks that
+# break them, so a whole (realizations x weeks) ensemble is scanned in a few
+# array operations instead of slicing and scanning every window in Python.
+
+drought_weeks = 12
+
+# one row per drought event; iterating over the table gives rows that can be
+# indexed like the dicts of the original find_droughts (event['start'])
+event_dtype = np.dtype([("realization", np.int64), ("start", np.int64),
+                        ("end", np.int64), ("severity", float)])
+
+# Counts the weeks that meet a condition in every window
+# @param mask The (realizations x weeks) condition
+# @param n_starts The number of windows
+# @param window The number of weeks of a window
+# @returns the (realizations x n_starts) counts
+
+def _window_counts(mask, n_starts, window):
+    counts = np.zeros((mask.shape[0], mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(mask, axis=1, out=counts[:, 1:])
+    return counts[:, window:window + n_starts] - counts[:, :n_starts]
+
+# Finds the SSI6 drought events of one or more realizations
+# Same windows and severities as the original find_droughts (kept in
+# tests/test_droughts.py, which checks them against each other): windows start
+# at every week but the last drought_weeks weeks, and the severity is the sum
+# of the SSI6 over the window
+# @param ssi6 The SSI6 timeseries, one realization or (realizations x weeks)
+# @param window The number of weeks of a drought
+# @returns the event table, sorted by realization and start week
+
+def drought_events(ssi6, window=drought_weeks):
+    ssi6 = np.atleast_2d(ssi6)
+    n_starts = max(ssi6.shape[1] - window, 0)
+    if n_starts == 0:
+        return np.zeros(0, dtype=event_dtype)
+
+    wet = _window_counts(ssi6 > 0, n_starts, window)        # rolling max > 0
+    severe = _window_counts(ssi6 <= -1, n_starts, window)   # rolling min <= -1
+    realization, start = np.nonzero((wet == 0) & (severe > 0))
+
+    events = np.zeros(len(start), dtype=event_dtype)
+    events["realization"] = realization
+    events["start"] = start
+    events["end"] = start + window - 1
+    events["severity"] = ssi6[realization[:, None], start[:, None] + np.arange(window)].sum(axis=1)
+    return events
+
+# Gets the events of one realization from an event table
+# @param events The event table
+# @param r The realization
+# @returns the events of realization r
+
+def realization_events(events, r):
+    return events[events["realization"] == r]
@@ -0,0 +1,206 @@
+import numpy as np
+from . import kernels, instrument
+
+# Batched risk-of-failure (ROF) engine ##############################
+# Computes a full ROF table for one demand realization. Every storage tier,
+# every week of the demand timeseries and every historical year is simulated
+# at once as a (tiers x weeks x historical years) storage array, stepping the
+# 52 weeks of the ROF window together. Failures are tracked with a mask so
+# that a path which has already failed no longer counts.
+#
+# The arithmetic is done in the same order as Reservoir.calc_storage and
+# Reservoir.check_failure so that the tables are identical, bit for bit, to
+# those generated by rof_table_scalar.
+#
+# Adaptive mode: the weekly update and the failure test never decrease when
+# the starting storage increases (rounding and clipping included), so a ROF
+# simulation that survives from one tier also survives from every higher
+# tier. Each (week, historical year) path therefore has a single transition
+# tier below which it fails, which rof_table_adaptive finds by bisection:
+# ~log2(tiers) simulations per path instead of one per tier, and paths that
+# fail or survive from every tier are settled without simulating the tiers
+# in between. The tables are identical to those of rof_table.
+
+# ROF tables ########################################################
+
+# Generates the ROF table of one realization one step at a time
+# This is the reference implementation that rof_table is checked against
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @returns the (tiers x weeks) ROF table
+
+def rof_table_scalar(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                     reservoir, n_hist_years, n_weeks=52):
+    rof_table_r = np.zeros((len(tiers), len(demand_r)-n_weeks), dtype=float)
+
+    for t in range(len(tiers)):
+        storage_tier = tiers[t]*reservoir.capacity
+
+        for w in range(n_weeks, len(demand_r)):
+            fail_count = 0
+            demand_year = demand_r[w-n_weeks:w]
+            for n in range(n_hist_years):
+                idx_start = n*n_weeks + (w-n_weeks)
+                idx_end = (n+1)*n_weeks + (w-n_weeks)
+                evap_year = evap_timeseries[idx_start : idx_end]
+                inflow_year = inflow_timeseries[idx_start : idx_end]
+                s_t = storage_tier
+                for d in range(len(demand_year)):
+                    s_tnext = reservoir.calc_storage(s_t, evap_year[d], inflow_year[d],
+                                                     demand_year[d])
+                    if (reservoir.check_failure(s_tnext) == 0):
+                        s_t = s_tnext
+                    else:
+                        fail_count += 1
+                        break
+            rof_table_r[t, w-n_weeks] = fail_count / n_hist_years
+    return rof_table_r
+
+# Generates the ROF table of one realization with all tiers, weeks and
+# historical years simulated together
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @param adaptive If True, bisect for the transition tier of every ROF
+#                 simulation instead of simulating every tier
+# @returns the (tiers x weeks) ROF table, identical to rof_table_scalar
+
+@instrument.timed("rof_table")
+def rof_table(demand_r, evap_timeseries, inflow_timeseries, tiers,
+              reservoir, n_hist_years, n_weeks=52, adaptive=False):
+    if kernels.use_jit():
+        table, n_simulations, n_updates = kernels.rof_table_jit(
+            demand_r, evap_timeseries, inflow_timeseries, tiers, reservoir, n_hist_years,
+            n_weeks, adaptive)
+        instrument.count("rof_simulations", n_simulations)
+        instrument.count("calc_storage", n_updates)
+        return table
+    if adaptive:
+        return rof_table_adaptive(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                                  reservoir, n_hist_years, n_weeks)
+    demand_r = np.asarray(demand_r, dtype=float)
+    evap_timeseries = np.asarray(evap_timeseries, dtype=float)
+    inflow_timeseries = np.asarray(inflow_timeseries, dtype=float)
+    tiers = np.asarray(tiers, dtype=float)
+
+    # week w of the table starts its ROF window at demand week w and
+    # historical week n*n_weeks + w for the n-th historical year
+    n_rof_weeks = len(demand_r) - n_weeks
+    starts = np.arange(n_rof_weeks)
+    hist_starts = starts[:, None] + n_weeks*np.arange(n_hist_years)[None, :]
+
+    storage_tier = tiers*reservoir.capacity
+    s_t = np.repeat(storage_tier[:, None, None], n_rof_weeks, axis=1)
+    s_t = np.repeat(s_t, n_hist_years, axis=2)
+    failed = np.zeros(s_t.shape, dtype=bool)
+    fail_t = np.empty(s_t.shape, dtype=bool)
+    instrument.count("rof_simulations", s_t.size)
+
+    for d in range(n_weeks):
+        evap_d = evap_timeseries[hist_starts + d]
+        inflow_d = inflow_timeseries[hist_starts + d]
+        demand_d = demand_r[starts + d][:, None]
+
+        # calc_storage counts the updates of the paths that have not failed,
+        # as the compiled loops and rof_table_scalar do
+        if instrument.enabled():
+            instrument.count("calc_storage", s_t.size - np.count_nonzero(failed))
+        reservoir.step(s_t, evap_d, inflow_d, demand_d, out=s_t)
+
+        # a path that has failed stays failed; its storage no longer matters
+        reservoir.failed(s_t, out=fail_t)
+        np.logical_or(failed, fail_t, out=failed)
+        if failed.all():
+            break
+
+    fail_count = np.count_nonzero(failed, axis=2)
+    return fail_count / n_hist_years
+
+# Checks which of a set of ROF simulations fail, each with its own starting
+# storage and window; simulations are dropped as soon as they fail
+# @param s0 The starting storage of each simulation
+# @param demand_starts The first demand week of each simulation
+# @param hist_starts The first historical week of each simulation
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param reservoir The reservoir
+# @param n_weeks The number of weeks in a year
+# @returns True for the simulations that fail
+
+def _simulations_fail(s0, demand_starts, hist_starts, demand_r, evap_timeseries,
+                      inflow_timeseries, reservoir, n_weeks):
+    failed = np.zeros(len(s0), dtype=bool)
+    alive = np.arange(len(s0))
+    s_t = np.array(s0, dtype=float)
+    instrument.count("rof_simulations", len(s_t))
+    for d in range(n_weeks):
+        reservoir.step(s_t, evap_timeseries[hist_starts + d], inflow_timeseries[hist_starts + d],
+                       demand_r[demand_starts + d], out=s_t)
+        instrument.count("calc_storage", len(s_t))
+        fail_t = reservoir.failed(s_t)
+        if fail_t.any():
+            failed[alive[fail_t]] = True
+            keep = ~fail_t
+            alive, s_t = alive[keep], s_t[keep]
+            demand_starts, hist_starts = demand_starts[keep], hist_starts[keep]
+            if len(alive) == 0:
+                break
+    return failed
+
+# Generates the ROF table of one realization by bisecting for the transition
+# tier of every (week, historical year) ROF simulation
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @returns the (tiers x weeks) ROF table, identical to rof_table
+
+def rof_table_adaptive(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                       reservoir, n_hist_years, n_weeks=52):
+    demand_r = np.asarray(demand_r, dtype=float)
+    evap_timeseries = np.asarray(evap_timeseries, dtype=float)
+    inflow_timeseries = np.asarray(inflow_timeseries, dtype=float)
+    tiers = np.asarray(tiers, dtype=float)
+
+    # the bisection runs over the tiers in increasing order of storage
+    order = np.argsort(tiers, kind="stable")
+    storage_tier = (tiers*reservoir.capacity)[order]
+    n_tiers = len(tiers)
+
+    n_rof_weeks = len(demand_r) - n_weeks
+    demand_starts = np.repeat(np.arange(n_rof_weeks), n_hist_years)
+    hist_starts = demand_starts + n_weeks*np.tile(np.arange(n_hist_years), n_rof_weeks)
+
+    # every simulation fails from the (sorted) tiers below lo and survives
+    # from the tiers at and above hi; bisect until they meet
+    lo = np.zeros(len(demand_starts), dtype=np.int64)
+    hi = np.full(len(demand_starts), n_tiers, dtype=np.int64)
+    active = np.arange(len(demand_starts))
+    while len(active) > 0:
+        mid = (lo[active] + hi[active]) // 2
+        fails = _simulations_fail(storage_tier[mid], demand_starts[active], hist_starts[active],
+                                  demand_r, evap_timeseries, inflow_timeseries,
+                                  reservoir, n_weeks)
+        lo[active[fails]] = mid[fails] + 1
+        hi[active[~fails]] = mid[~fails]
+        active = active[lo[active] < hi[active]]
+
+    # failures of each tier and week: the simulations whose transition is above it
+    n_failing = lo.reshape(n_rof_weeks, n_hist_years)
+    fail_count = np.empty((n_tiers, n_rof_weeks), dtype=np.int64)
+    for j in range(n_tiers):
+        fail_count[order[j]] = np.count_nonzero(n_failing > j, axis=1)
+    return fail_count / n_hist_years
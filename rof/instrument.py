@@ -0,0 +1,192 @@
+import numpy as np
+import atexit
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import time
+
+# Instrumentation ###################################################
+# Counters and timers for the phases of a run: loading the inputs, the ROF
+# table of each realization, the policy simulation and the output writes,
+# along with the number of storage updates (calc_storage) and ROF lookups
+# (trigger_restriction) they perform. Counting is done once per batched step
+# or per call, never per element, and everything is skipped while the
+# instrumentation is disabled.
+#
+# It is enabled with enable() or, without editing the scripts, through
+# environment variables (inherited by worker processes, whose counts are
+# sent back with their results):
+#     ROF_INSTRUMENT=1         print the counters and timers when the run ends
+#     ROF_INSTRUMENT=file.json also write them to file.json
+#     ROF_TRACE=file.json      write every timed span as a Chrome trace
+#                              (chrome://tracing, Perfetto)
+#     ROF_PROFILE=file.prof    profile the whole run with cProfile (pstats, snakeviz)
+
+counters = {}   # name -> count
+timers = {}     # name -> [calls, seconds]
+events = []     # timed spans, kept for the trace only
+_state = {"enabled": (os.environ.get("ROF_INSTRUMENT", "0") not in ("", "0")
+                     or bool(os.environ.get("ROF_TRACE"))),
+          "trace": (os.environ.get("ROF_INSTRUMENT") == "trace"
+                    or bool(os.environ.get("ROF_TRACE")))}
+
+# Enables or disables the counters and timers, here and in worker processes
+# started afterwards
+# @param on True to enable
+# @param trace True to also keep every timed span for a trace export
+
+def enable(on=True, trace=False):
+    _state["enabled"] = on
+    _state["trace"] = on and trace
+    os.environ["ROF_INSTRUMENT"] = ("trace" if trace else "1") if on else "0"
+
+# Checks if the instrumentation is enabled
+def enabled():
+    return _state["enabled"]
+
+# Adds to a counter
+# @param name The counter
+# @param n The amount to add
+
+def count(name, n=1):
+    if _state["enabled"]:
+        counters[name] = counters.get(name, 0) + int(n)
+
+class timer:
+    '''Context manager that adds the time spent in its block to a timer'''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if _state["enabled"]:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if _state["enabled"]:
+            end = time.perf_counter()
+            entry = timers.setdefault(self.name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += end - self.start
+            if _state["trace"]:
+                events.append((self.name, self.start, end - self.start, os.getpid()))
+        return False
+
+# Decorates a function to time every call to it
+# @param name The timer
+# @returns the decorator
+
+def timed(name):
+    def decorate(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Clears every counter and timer
+def reset():
+    counters.clear()
+    timers.clear()
+    events.clear()
+
+# Gets a copy of the counters and timers, e.g. to send back from a worker
+# @returns the counters, timers and trace events
+
+def snapshot():
+    if not _state["enabled"]:
+        return None
+    return {"counters": dict(counters), "timers": {k: list(v) for k, v in timers.items()},
+            "events": list(events)}
+
+# Adds the counters and timers of a snapshot, e.g. from a worker
+# @param stats The snapshot
+
+def merge(stats):
+    if not stats or not _state["enabled"]:
+        return
+    for name, n in stats["counters"].items():
+        counters[name] = counters.get(name, 0) + n
+    for name, (calls, seconds) in stats["timers"].items():
+        entry = timers.setdefault(name, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+    events.extend(stats["events"])
+
+# Formats the counters and timers as a table
+# Timers of worker processes add up, so they can exceed the wall time
+# @returns the report
+
+def report():
+    lines = [f"{'timer':<24}{'calls':>10}{'seconds':>12}{'mean (ms)':>12}"]
+    for name, (calls, seconds) in sorted(timers.items(), key=lambda x: -x[1][1]):
+        lines.append(f"{name:<24}{calls:>10}{seconds:>12.4f}{1000*seconds/max(calls, 1):>12.3f}")
+    # every alpha of a policy simulation is simulated in the same pass
+    if "policy" in timers and counters.get("policy_alphas"):
+        n = counters["policy_alphas"]
+        lines.append(f"{'policy per alpha':<24}{n:>10}{timers['policy'][1]:>12.4f}"
+                     f"{1000*timers['policy'][1]/n:>12.3f}")
+    lines.append(f"{'counter':<24}{'count':>10}")
+    for name, n in sorted(counters.items()):
+        lines.append(f"{name:<24}{n:>10}")
+    return "\n".join(lines)
+
+# Writes the counters and timers to a JSON file
+# @param file_name The file name
+
+def save_report(file_name):
+    with open(file_name, "w") as f:
+        json.dump({"counters": counters, "timers": timers}, f, indent=2)
+
+# Writes the timed spans as a Chrome trace (requires enable(trace=True) or ROF_TRACE)
+# @param file_name The file name
+
+def save_trace(file_name):
+    t0 = min((e[1] for e in events), default=0.0)
+    trace = [{"name": name, "ph": "X", "ts": 1e6*(start - t0), "dur": 1e6*duration,
+              "pid": pid, "tid": pid}
+             for name, start, duration, pid in events]
+    with open(file_name, "w") as f:
+        json.dump({"traceEvents": trace}, f)
+
+class Progress:
+    '''Progress and estimated time remaining of a run of total items'''
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    # Marks items as done
+    # @param n The number of items done
+    def update(self, n=1):
+        self.done += n
+
+    def __str__(self):
+        elapsed = time.perf_counter() - self.start
+        eta = elapsed*(self.total - self.done)/self.done if self.done else np.nan
+        return f"{self.done} of {self.total}, {elapsed:0.1f} s elapsed, ETA {eta:0.1f} s"
+
+# Reports the counters and timers, and writes the trace and profile requested
+# through the environment, when the main process exits
+def _at_exit(profiler):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.environ["ROF_PROFILE"])
+    if _state["enabled"] and (timers or counters):
+        print(report())
+        if os.environ.get("ROF_INSTRUMENT", "").endswith(".json"):
+            save_report(os.environ["ROF_INSTRUMENT"])
+    if os.environ.get("ROF_TRACE") and events:
+        save_trace(os.environ["ROF_TRACE"])
+
+if multiprocessing.parent_process() is None:
+    _profiler = None
+    if os.environ.get("ROF_PROFILE"):
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_at_exit, _profiler)
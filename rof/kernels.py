@@ -0,0 +1,261 @@
+import numpy as np
+import math
+import os
+import warnings
+
+# Compiled scalar kernels ###########################################
+# Some of the simulation is inherently sequential: a ROF simulation stops at
+# its first failure, and a triggered restriction holds the demand at 80% for
+# the next 4 weeks. These loops are written here once, one element at a time,
+# and compiled with Numba when it is installed. They do the same arithmetic in
+# the same order as Reservoir.calc_storage/check_failure and the restriction
+# policy, so the results are identical to the NumPy backend.
+#
+# The backend is chosen at runtime with set_backend("jit") / set_backend("numpy")
+# or the ROF_BACKEND environment variable, which worker processes inherit.
+# Without Numba the "jit" backend falls back to the NumPy backend.
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+backends = ("numpy", "jit")
+
+# Selects the backend of the ROF engine and the policy simulation
+# @param name "numpy" for the vectorized NumPy code, "jit" for the compiled loops
+
+def set_backend(name):
+    if name not in backends:
+        raise ValueError(f"unknown backend {name!r}, expected one of {backends}")
+    if name == "jit" and not HAVE_NUMBA:
+        warnings.warn("numba is not installed, using the numpy backend")
+        name = "numpy"
+    os.environ["ROF_BACKEND"] = name
+
+# Gets the selected backend
+def get_backend():
+    name = os.environ.get("ROF_BACKEND", "numpy")
+    if name == "jit" and HAVE_NUMBA:
+        return "jit"
+    return "numpy"
+
+# Checks if the compiled loops should be used
+def use_jit():
+    return get_backend() == "jit"
+
+# Generates the ROF table of one realization, stopping each ROF simulation at
+# its first failure (see engine.rof_table_scalar). Also returns the number of
+# storage updates
+def _rof_table_loop(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                    capacity, threshold, n_hist_years, n_weeks):
+    n_rof_weeks = len(demand_r) - n_weeks
+    rof_table_r = np.zeros((len(tiers), n_rof_weeks))
+    n_updates = 0
+    for t in range(len(tiers)):
+        storage_tier = tiers[t]*capacity
+        for w in range(n_rof_weeks):
+            fail_count = 0
+            for n in range(n_hist_years):
+                idx_start = n*n_weeks + w
+                s_t = storage_tier
+                for d in range(n_weeks):
+                    s_tnext = (s_t - evap_timeseries[idx_start+d] + inflow_timeseries[idx_start+d]
+                               - demand_r[w+d])
+                    n_updates += 1
+                    if (s_tnext/capacity) >= 1.0:
+                        s_tnext = capacity
+                    elif s_tnext < 0:
+                        s_tnext = 0.0
+                    if (s_tnext/capacity) < threshold:
+                        fail_count += 1
+                        break
+                    s_t = s_tnext
+            rof_table_r[t, w] = fail_count / n_hist_years
+    return rof_table_r, n_updates
+
+# Checks if one ROF simulation fails (see engine._simulations_fail)
+# Returns the number of storage updates, negative if the simulation fails
+def _simulation_fails(s_t, demand_r, evap_timeseries, inflow_timeseries, w, idx_start,
+                      capacity, threshold, n_weeks):
+    for d in range(n_weeks):
+        s_tnext = (s_t - evap_timeseries[idx_start+d] + inflow_timeseries[idx_start+d]
+                   - demand_r[w+d])
+        if (s_tnext/capacity) >= 1.0:
+            s_tnext = capacity
+        elif s_tnext < 0:
+            s_tnext = 0.0
+        if (s_tnext/capacity) < threshold:
+            return -(d + 1)
+        s_t = s_tnext
+    return n_weeks
+
+# Generates the ROF table of one realization by bisecting for the transition
+# tier of every ROF simulation (see engine.rof_table_adaptive). Also returns
+# the number of ROF simulations and storage updates
+def _rof_table_adaptive_loop(demand_r, evap_timeseries, inflow_timeseries, storage_tier,
+                             order, capacity, threshold, n_hist_years, n_weeks):
+    n_tiers = len(storage_tier)
+    n_rof_weeks = len(demand_r) - n_weeks
+    fail_count = np.zeros((n_tiers, n_rof_weeks), dtype=np.int64)
+    n_simulations = 0
+    n_updates = 0
+    for w in range(n_rof_weeks):
+        for n in range(n_hist_years):
+            lo = 0
+            hi = n_tiers
+            while lo < hi:
+                mid = (lo + hi) // 2
+                updates = _simulation_fails(storage_tier[mid], demand_r, evap_timeseries,
+                                            inflow_timeseries, w, n*n_weeks + w,
+                                            capacity, threshold, n_weeks)
+                n_simulations += 1
+                n_updates += abs(updates)
+                if updates < 0:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            for j in range(lo):
+                fail_count[order[j], w] += 1
+    return fail_count / n_hist_years, n_simulations, n_updates
+
+# Gets the row of the ROF table for a fraction of capacity (see policy.tier_row)
+def _tier_row(frac_capacity, rows, bounds, n_steps):
+    k = min(max(math.ceil(frac_capacity*n_steps), 0), n_steps + 1)
+    if k > 0 and frac_capacity <= bounds[k-1]:
+        k -= 1
+    elif k <= n_steps and frac_capacity > bounds[k]:
+        k += 1
+    return rows[k]
+
+# Simulates the restriction policy of every realization and alpha one week at
+# a time (see policy.simulate_realization). Each realization has its own
+# capacity and failure threshold. The weekly dynamics are only written when
+# record is True.
+def _policy_loop(demand_r, inflow_r, evap_r, rof_tables, rows, bounds, n_steps,
+                 alphas, tier, capacity, threshold, restr_factor, restr_weeks,
+                 failed, rf_count, record, restr_freq, restr_demand,
+                 storage_dynamics, short_term_risk):
+    N_reals, n_policy_weeks = demand_r.shape
+    for a in range(len(alphas)):
+        alpha = alphas[a]
+        for r in range(N_reals):
+            cap = capacity[r]
+            s_t = cap*tier[a]
+            failed[r, a] = s_t < (threshold[r]*cap)
+            hold = 0
+            risk = rof_tables[r, _tier_row(s_t/cap, rows, bounds, n_steps), 0]
+            if record:
+                storage_dynamics[a, r, 0] = s_t
+                short_term_risk[a, r, 0] = risk
+            for w in range(1, n_policy_weeks):
+                if hold == 0 and risk > alpha:
+                    hold = min(restr_weeks[a], n_policy_weeks-w)
+                    rf_count[r, a] += 1
+                    if record:
+                        restr_freq[a, r, w-1] = 1
+                d_t = demand_r[r, w-1]
+                if hold > 0:
+                    d_t = restr_factor[a]*d_t
+                    hold -= 1
+                s_t = s_t - evap_r[r, w-1] + inflow_r[r, w-1] - d_t
+                if (s_t/cap) >= 1.0:
+                    s_t = cap
+                elif s_t < 0:
+                    s_t = 0.0
+                risk = rof_tables[r, _tier_row(s_t/cap, rows, bounds, n_steps), w]
+                if s_t < (threshold[r]*cap):
+                    failed[r, a] = True
+                if record:
+                    restr_demand[a, r, w-1] = d_t
+                    storage_dynamics[a, r, w] = s_t
+                    short_term_risk[a, r, w] = risk
+
+if HAVE_NUMBA:
+    _rof_table_loop = njit(cache=True)(_rof_table_loop)
+    _simulation_fails = njit(cache=True)(_simulation_fails)
+    _rof_table_adaptive_loop = njit(cache=True)(_rof_table_adaptive_loop)
+    _tier_row = njit(cache=True)(_tier_row)
+    _policy_loop = njit(cache=True)(_policy_loop)
+
+# Generates the ROF table of one realization with the compiled loops
+# @param demand_r The demand timeseries of the realization
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @param adaptive If True, bisect for the transition tier of every ROF simulation
+# @returns the (tiers x weeks) ROF table, the number of ROF simulations and
+#          the number of storage updates
+
+def rof_table_jit(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                  reservoir, n_hist_years, n_weeks=52, adaptive=False):
+    if adaptive:
+        tiers = np.asarray(tiers, dtype=float)
+        order = np.argsort(tiers, kind="stable")
+        return _rof_table_adaptive_loop(np.ascontiguousarray(demand_r, dtype=float),
+                                        np.ascontiguousarray(evap_timeseries, dtype=float),
+                                        np.ascontiguousarray(inflow_timeseries, dtype=float),
+                                        np.ascontiguousarray((tiers*reservoir.capacity)[order]),
+                                        order.astype(np.int64),
+                                        float(reservoir.capacity), float(reservoir.threshold),
+                                        int(n_hist_years), int(n_weeks))
+    table, n_updates = _rof_table_loop(np.ascontiguousarray(demand_r, dtype=float),
+                                       np.ascontiguousarray(evap_timeseries, dtype=float),
+                                       np.ascontiguousarray(inflow_timeseries, dtype=float),
+                                       np.ascontiguousarray(tiers, dtype=float),
+                                       float(reservoir.capacity), float(reservoir.threshold),
+                                       int(n_hist_years), int(n_weeks))
+    return table, len(tiers)*(len(demand_r) - n_weeks)*n_hist_years, n_updates
+
+# Simulates the restriction policy of every realization and alpha with the
+# compiled loops
+# @param demand_r The (realizations x weeks) demand of the policy simulation
+# @param inflow_r The (realizations x weeks) inflow of the policy simulation
+# @param evap_r The (realizations x weeks) evaporation of the policy simulation
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param rows The ROF table row of each 5% tier step (see policy.tier_rows)
+# @param bounds The fraction of capacity of each 5% tier step
+# @param alphas The ROF triggers to evaluate
+# @param tier The initial storage as a fraction of full capacity, one or one per alpha
+# @param reservoir The reservoir; its capacity and threshold may be
+#        (realizations x 1) arrays
+# @param restr_factor The fraction of demand met during water restrictions,
+#        one or one per alpha
+# @param restr_weeks The number of weeks a restriction is held for, one or one per alpha
+# @param return_dynamics If True, also return the weekly dynamics
+# @returns the (realizations x alphas) failures and restriction counts,
+#          followed by the weekly dynamics if return_dynamics is True
+
+def policy_jit(demand_r, inflow_r, evap_r, rof_tables, rows, bounds, alphas, tier,
+               reservoir, restr_factor, restr_weeks, return_dynamics):
+    N_reals, n_policy_weeks = demand_r.shape
+    N_alphas = len(alphas)
+    shape = (N_alphas, N_reals, n_policy_weeks) if return_dynamics else (0, 0, 0)
+    restr_freq = np.zeros(shape, dtype=np.int64)
+    restr_demand = np.zeros(shape)
+    storage_dynamics = np.zeros(shape)
+    short_term_risk = np.zeros(shape)
+    failed = np.zeros((N_reals, N_alphas), dtype=np.bool_)
+    rf_count = np.zeros((N_reals, N_alphas), dtype=np.int64)
+    per_alpha = lambda x, dtype: np.ascontiguousarray(np.broadcast_to(np.asarray(x, dtype=dtype),
+                                                                      N_alphas))
+    capacity = np.broadcast_to(np.asarray(reservoir.capacity, dtype=float).reshape(-1), N_reals)
+    threshold = np.broadcast_to(np.asarray(reservoir.threshold, dtype=float).reshape(-1), N_reals)
+    _policy_loop(np.ascontiguousarray(demand_r, dtype=float),
+                 np.ascontiguousarray(inflow_r, dtype=float),
+                 np.ascontiguousarray(evap_r, dtype=float),
+                 np.ascontiguousarray(rof_tables, dtype=float),
+                 np.ascontiguousarray(rows, dtype=np.int64),
+                 np.ascontiguousarray(bounds, dtype=float), len(bounds) - 2,
+                 np.ascontiguousarray(alphas, dtype=float), per_alpha(tier, float),
+                 np.ascontiguousarray(capacity), np.ascontiguousarray(threshold),
+                 per_alpha(restr_factor, float), per_alpha(restr_weeks, np.int64),
+                 failed, rf_count, bool(return_dynamics), restr_freq, restr_demand,
+                 storage_dynamics, short_term_risk)
+    if return_dynamics:
+        return failed, rf_count, restr_freq, restr_demand, storage_dynamics, short_term_risk
+    return failed, rf_count
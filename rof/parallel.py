@@ -0,0 +1,140 @@
+import numpy as np
+from multiprocessing import Pool, shared_memory
+from .engine import rof_table
+from . import instrument
+
+# Parallel ROF table generation #####################################
+# The ROF table of each realization depends only on its own demand row and
+# on the historical evaporation and inflow timeseries, which are shared by
+# every realization. The hydrology is copied once into shared memory and
+# every worker process maps it, so only the (small) demand rows are sent
+# with each task. Realizations can also be split into blocks of weeks so
+# that all cores stay busy when there are fewer realizations than workers.
+
+# Shared inputs of a process pool ###################################
+# Inputs used by every task are copied once into shared memory blocks, which
+# every worker process maps when it starts, so only the small per-task
+# arguments are sent with each task. rof.sweep uses the same helpers.
+
+# State of a worker process, set up once by _init_worker
+_worker = {}
+
+# Copies arrays into new shared memory blocks
+# @param arrays The arrays to share
+# @returns the shared memory blocks, to release with release_arrays, and the
+#          (shared memory name, shape, dtype) of each array for _init_worker
+
+def share_arrays(arrays):
+    shms, specs = [], []
+    try:
+        for x in arrays:
+            shm = shared_memory.SharedMemory(create=True, size=max(x.nbytes, 1))
+            shms.append(shm)
+            np.ndarray(x.shape, dtype=x.dtype, buffer=shm.buf)[:] = x
+            specs.append((shm.name, x.shape, x.dtype.str))
+    except BaseException:
+        release_arrays(shms)
+        raise
+    return shms, specs
+
+# Frees the shared memory blocks made by share_arrays
+# @param shms The shared memory blocks
+
+def release_arrays(shms):
+    for shm in shms:
+        shm.close()
+        shm.unlink()
+
+# Attaches a worker process to the shared inputs
+# @param specs The (shared memory name, shape, dtype) of each input
+# @param settings The arguments shared by every task
+
+def _init_worker(specs, settings):
+    _worker['shm'] = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    _worker['inputs'] = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                         for shm, (_, shape, dtype) in zip(_worker['shm'], specs)]
+    _worker['settings'] = settings
+
+# Computes the ROF table for a block of weeks of one realization
+# The ROF window of table week w starts at week w of both the demand and
+# the historical timeseries, so a block starting at week w0 only needs the
+# timeseries from w0 onwards
+# @param task The (realization, first week, last week, demand block) tuple
+# @returns the realization, the first week, the block of the ROF table and
+#          the instrumentation counts of the task
+
+def _rof_block(task):
+    r, w0, w1, demand_block = task
+    hydrology = _worker['inputs'][0]
+    tiers, reservoir, n_hist_years, n_weeks, adaptive = _worker['settings']
+    instrument.reset()
+    table = rof_table(demand_block, hydrology[0, w0:], hydrology[1, w0:], tiers,
+                      reservoir, n_hist_years, n_weeks, adaptive)
+    return r, w0, table, instrument.snapshot()
+
+# Splits every realization into blocks of weeks
+# @param demand The (realizations x weeks) demand array
+# @param n_weeks The number of weeks in a year
+# @param week_blocks The number of blocks each realization is split into
+# @returns the list of tasks for _rof_block
+
+def _make_tasks(demand, n_weeks, week_blocks):
+    n_rof_weeks = demand.shape[1] - n_weeks
+    bounds = np.linspace(0, n_rof_weeks, week_blocks + 1).astype(int)
+    tasks = []
+    for r in range(demand.shape[0]):
+        for b in range(week_blocks):
+            w0, w1 = bounds[b], bounds[b+1]
+            if w1 > w0:
+                tasks.append((r, w0, w1, demand[r, w0:w1+n_weeks]))
+    return tasks
+
+# Generates the ROF tables of several realizations across a process pool
+# Tables are yielded as soon as every block of a realization is done, so they
+# come back in completion order rather than realization order
+# @param demand The (realizations x weeks) demand array
+# @param evap_timeseries The historical evaporation timeseries
+# @param inflow_timeseries The historical inflow timeseries
+# @param tiers The storage tiers as fractions of full capacity
+# @param reservoir The reservoir
+# @param n_hist_years The number of historical years (ROF simulations) per entry
+# @param n_weeks The number of weeks in a year
+# @param n_workers The number of worker processes; 1 runs in this process
+# @param week_blocks The number of blocks of weeks each realization is split into
+# @param adaptive If True, bisect for the transition tier of every ROF simulation
+# @returns a generator of (realization, ROF table) pairs
+
+def generate_rof_tables(demand, evap_timeseries, inflow_timeseries, tiers,
+                        reservoir, n_hist_years, n_weeks=52,
+                        n_workers=1, week_blocks=1, adaptive=False):
+    demand = np.atleast_2d(np.asarray(demand, dtype=float))
+    n_rof_weeks = demand.shape[1] - n_weeks
+
+    if n_workers <= 1:
+        for r in range(demand.shape[0]):
+            yield r, rof_table(demand[r,:], evap_timeseries, inflow_timeseries, tiers,
+                               reservoir, n_hist_years, n_weeks, adaptive)
+        return
+
+    hydrology = np.stack([np.asarray(evap_timeseries, dtype=float),
+                          np.asarray(inflow_timeseries, dtype=float)])
+    shms, specs = share_arrays([hydrology])
+    try:
+        settings = (np.asarray(tiers, dtype=float), reservoir, n_hist_years, n_weeks, adaptive)
+        tasks = _make_tasks(demand, n_weeks, week_blocks)
+
+        tables = {}
+        weeks_done = {}
+        with Pool(n_workers, initializer=_init_worker, initargs=(specs, settings)) as pool:
+            for r, w0, block, stats in pool.imap_unordered(_rof_block, tasks):
+                instrument.merge(stats)
+                if r not in tables:
+                    tables[r] = np.zeros((len(settings[0]), n_rof_weeks), dtype=float)
+                    weeks_done[r] = 0
+                tables[r][:, w0:w0+block.shape[1]] = block
+                weeks_done[r] += block.shape[1]
+                if weeks_done[r] == n_rof_weeks:
+                    del weeks_done[r]
+                    yield r, tables.pop(r)
+    finally:
+        release_arrays(shms)
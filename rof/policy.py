@@ -0,0 +1,326 @@
+import numpy as np
+import math
+from decimal import Decimal
+from . import kernels, instrument
+from .data_io import DynamicsWriter, save_restriction_index
+from .restrictions import restriction_index, join_restriction_index
+
+# Multi-alpha restriction policy simulation ##########################
+# Simulates the ROF-triggered restriction policy for every
+# realization and every ROF trigger alpha in a single pass. The state of the
+# simulation (storage, remaining weeks of restriction, current ROF) is kept
+# as (realizations x alphas) arrays and the weeks are stepped together, so
+# the ROF tables are read once and the cost of a sweep barely depends on
+# the number of alphas.
+#
+# Unless the ROF is interpolated between tiers, the results are identical to
+# simulating each realization and alpha with simulate_realization.
+
+# Storage tier lookup ###############################################
+# trigger_restriction originally rounded the fraction of capacity up to the
+# next 5% tier with Decimal(str(frac)).quantize(...) on every call. Because
+# str() gives the shortest decimal that rounds to the float, that decimal is
+# above k/20 exactly when the float is above the float k/20, so the same tier
+# is found by comparing against the precomputed float tier bounds. The row
+# of the ROF table for each tier is precomputed with the original Decimal
+# arithmetic, which keeps the quirks of the original mapping (e.g. an empty
+# reservoir reads the last row).
+
+n_tier_steps = 20   # tiers in increments of 5%
+_tier_bounds = np.arange(n_tier_steps + 2)/n_tier_steps
+_tier_bounds_list = _tier_bounds.tolist()
+_tier_rows = {}
+
+# Gets the row of the ROF table for each 5% tier step, computed once
+# @param n_tiers The number of rows (storage tiers) of the ROF table
+# @returns the row index for tier steps k = 0, ..., n_tier_steps + 1
+
+def tier_rows(n_tiers):
+    if n_tiers not in _tier_rows:
+        rows = [int((Decimal(k)/10)/2*n_tiers)-1 for k in range(n_tier_steps + 2)]
+        # an empty reservoir indexes row -1, i.e. the last row
+        _tier_rows[n_tiers] = np.array([row % n_tiers if row < 0 else row for row in rows])
+    return _tier_rows[n_tiers]
+
+# Gets the 5% tier step of an array of fractions of capacity
+# The fraction is rounded up to the next 5% tier as in trigger_restriction
+# @param frac_capacity The storage as fractions of full capacity
+# @returns the tier steps k, so that the tier is k*5%
+
+def tier_step(frac_capacity):
+    frac_capacity = np.asarray(frac_capacity, dtype=float)
+    k = np.clip(np.ceil(frac_capacity*n_tier_steps), 0, n_tier_steps + 1).astype(int)
+    # frac*20 may round onto the wrong side of an integer; the bounds are exact
+    k -= (k > 0) & (frac_capacity <= _tier_bounds[k-1])
+    k += (k <= n_tier_steps) & (frac_capacity > _tier_bounds[k])
+    return k
+
+# Gets the rows of the ROF table for an array of fractions of capacity
+# @param frac_capacity The storage as fractions of full capacity
+# @param n_tiers The number of rows (storage tiers) of the ROF table
+# @returns the row indices into the ROF table
+
+def tier_index(frac_capacity, n_tiers):
+    return tier_rows(n_tiers)[tier_step(frac_capacity)]
+
+# Gets the row of the ROF table for a single fraction of capacity
+# Same as tier_index without the overhead of numpy on scalars
+# @param frac_capacity The storage as a fraction of full capacity
+# @param n_tiers The number of rows (storage tiers) of the ROF table
+# @returns the row index into the ROF table
+
+def tier_row(frac_capacity, n_tiers):
+    k = min(max(math.ceil(frac_capacity*n_tier_steps), 0), n_tier_steps + 1)
+    if k > 0 and frac_capacity <= _tier_bounds_list[k-1]:
+        k -= 1
+    elif k <= n_tier_steps and frac_capacity > _tier_bounds_list[k]:
+        k += 1
+    return int(tier_rows(n_tiers)[k])
+
+# Gets the ROF linearly interpolated between the two tiers around the storage
+# The rows of the ROF table are assumed to be evenly spaced from 0% to 100%
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param rows The realization of each storage
+# @param frac_capacity The storage as fractions of full capacity
+# @param w The week
+# @returns the interpolated ROF
+
+def interpolate_rof(rof_tables, rows, frac_capacity, w):
+    n_tiers = rof_tables.shape[1]
+    pos = np.clip(frac_capacity, 0.0, 1.0)*(n_tiers-1)
+    lower = np.minimum(np.floor(pos).astype(int), n_tiers-2)
+    weight = pos - lower
+    rof_lower = rof_tables[rows, lower, w]
+    rof_upper = rof_tables[rows, lower+1, w]
+    return rof_lower + weight*(rof_upper - rof_lower)
+
+# Gets the ROF of the tier of each storage
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param rows The realization of each storage
+# @param frac_capacity The storage as fractions of full capacity
+# @param w The week
+# @param interpolate If True, interpolate between tiers instead of rounding up
+# @returns the ROF
+
+def lookup_rof(rof_tables, rows, frac_capacity, w, interpolate=False):
+    if interpolate:
+        return interpolate_rof(rof_tables, rows, frac_capacity, w)
+    return rof_tables[rows, tier_index(frac_capacity, rof_tables.shape[1]), w]
+
+# Simulates the restriction policy of one realization one week at a time
+# This is the original tradeoff.storage loop, kept as the reference that
+# simulate_policy is checked against
+# @param demand_r The demand of the policy simulation
+# @param inflow_r The inflow of the policy simulation
+# @param evap_r The evaporation of the policy simulation
+# @param rof_r The (tiers x weeks) ROF table of the realization
+# @param alpha The ROF trigger
+# @param tier The initial storage as a fraction of full capacity
+# @param reservoir The reservoir
+# @param restr_factor The fraction of demand met during water restrictions
+# @param restr_weeks The number of weeks a restriction is held for
+# @returns the weekly restriction frequency, restricted demand, storage and
+#          short-term risk
+
+def simulate_realization(demand_r, inflow_r, evap_r, rof_r, alpha, tier, reservoir,
+                         restr_factor=0.8, restr_weeks=4):
+    n_tiers = rof_r.shape[0]
+    storage_r = np.zeros(len(demand_r), dtype=float)
+    rf_r = np.zeros(len(demand_r), dtype=int)
+    rd_r = np.zeros(len(demand_r), dtype=float)
+    risk_r = np.zeros(len(demand_r), dtype=float)
+    storage_r[0] = reservoir.capacity*tier
+    w = 1
+    while w < len(demand_r):
+        rof_rw = rof_r[tier_row(storage_r[w-1]/reservoir.capacity, n_tiers), w-1]
+        risk_r[w-1] = rof_rw
+        # during water restrictions, only part of the demand is met
+        if rof_rw > alpha:
+            mth = min(restr_weeks, len(demand_r)-w)
+            rf_r[w-1] = 1
+            for m in range(mth):
+                rd_r[w-1] = restr_factor*demand_r[w-1]
+                storage_r[w] = reservoir.calc_storage(storage_r[w-1], evap_r[w-1], inflow_r[w-1],
+                                                      restr_factor*demand_r[w-1])
+                risk_r[w] = rof_r[tier_row(storage_r[w]/reservoir.capacity, n_tiers), w]
+                w += 1
+        else:
+            rd_r[w-1] = demand_r[w-1]
+            storage_r[w] = reservoir.calc_storage(storage_r[w-1], evap_r[w-1], inflow_r[w-1],
+                                                  demand_r[w-1])
+            risk_r[w] = rof_r[tier_row(storage_r[w]/reservoir.capacity, n_tiers), w]
+            w += 1
+    return rf_r, rd_r, storage_r, risk_r
+
+# Simulates the restriction policy for every realization and alpha
+# @param water_balance The water balance
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param alphas The ROF triggers to evaluate
+# @param tier The initial storage as a fraction of full capacity
+# @param reservoir The reservoir
+# @param restr_factor The fraction of demand met during water restrictions
+# @param restr_weeks The number of weeks a restriction is held for
+# @param interpolate If True, interpolate the ROF between tiers instead of
+#        rounding the storage up to the next tier
+# @param return_dynamics If True, also return the weekly dynamics
+# @returns the reliability and the average restriction frequency of each alpha,
+#          followed by the (alphas x realizations x weeks) restriction frequency,
+#          restricted demand, storage and short-term risk if return_dynamics is True
+
+def simulate_policy(water_balance, rof_tables, alphas, tier, reservoir,
+                    restr_factor=0.8, restr_weeks=4, interpolate=False, return_dynamics=False):
+    rof_tables = np.asarray(rof_tables, dtype=float)
+    N_reals = rof_tables.shape[0]
+    demand_r, inflow_r, evap_r = water_balance.policy_inputs(slice(0, N_reals))
+    out = simulate_restrictions(demand_r, inflow_r, evap_r, rof_tables, alphas, tier, reservoir,
+                                restr_factor, restr_weeks, interpolate, return_dynamics)
+    reliability = 1.0 - (out[0].sum(axis=0)/N_reals)
+    rf_avg = out[1].sum(axis=0)/N_reals
+    return (reliability, rf_avg) + tuple(out[2:])
+
+# Simulates the restriction policy for every realization and alpha, one block
+# of realizations at a time. Reliability and restriction frequency are
+# accumulated as the blocks complete and the weekly dynamics of each block are
+# written to disk straight away, so the memory used depends on the block size
+# and not on the number of realizations. The restriction index of every
+# realization and alpha (see rof.restrictions) is built from the blocks and
+# written with the dynamics
+# @param water_balance The water balance
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param alphas The ROF triggers to evaluate
+# @param tier The initial storage as a fraction of full capacity
+# @param reservoir The reservoir
+# @param restr_factor The fraction of demand met during water restrictions
+# @param restr_weeks The number of weeks a restriction is held for
+# @param interpolate If True, interpolate the ROF between tiers
+# @param block_size The number of realizations simulated at a time
+# @param dynamics_path The dynamics folder; None to skip the weekly dynamics
+# @param output_format The format of the weekly dynamics, "npy", "csv" or "compact"
+# @returns the reliability and the average restriction frequency of each alpha,
+#          identical to simulate_policy
+
+def simulate_policy_chunked(water_balance, rof_tables, alphas, tier, reservoir,
+                            restr_factor=0.8, restr_weeks=4, interpolate=False,
+                            block_size=50, dynamics_path=None, output_format="npy"):
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    N_reals = len(rof_tables)
+    n_policy_weeks = water_balance.demand.shape[1] - water_balance.n_weeks
+    fail_count = np.zeros(len(alphas), dtype=int)
+    rf_total = np.zeros(len(alphas), dtype=int)
+
+    writer = None
+    index = []
+    if dynamics_path is not None:
+        writer = DynamicsWriter(dynamics_path, tier, alphas, N_reals, n_policy_weeks,
+                                output_format)
+    try:
+        for r0 in range(0, N_reals, block_size):
+            block = slice(r0, min(r0 + block_size, N_reals))
+            demand_r, inflow_r, evap_r = (np.array(x, dtype=float)
+                                          for x in water_balance.policy_inputs(block))
+            out = simulate_restrictions(demand_r, inflow_r, evap_r,
+                                        np.asarray(rof_tables[block], dtype=float),
+                                        alphas, tier, reservoir, restr_factor, restr_weeks,
+                                        interpolate, writer is not None)
+            fail_count += out[0].sum(axis=0)
+            rf_total += out[1].sum(axis=0)
+            if writer is not None:
+                writer.write(r0, *out[2:])
+                index.append(restriction_index(out[2], restr_weeks, r0))
+    finally:
+        if writer is not None:
+            writer.close()
+    if index:
+        save_restriction_index(dynamics_path, tier, alphas, *join_restriction_index(index))
+
+    reliability = 1.0 - (fail_count/N_reals)
+    rf_avg = rf_total/N_reals
+    return reliability, rf_avg
+
+# Simulates the restriction policy of every realization and alpha from the
+# policy inputs. Each realization may have its own reservoir: the capacity and
+# threshold of the reservoir may be (realizations x 1) arrays, which is how
+# several utilities are simulated together (see rof.utilities). The initial
+# tier and the restriction parameters may be given per alpha, which is how a
+# sweep over policy variants runs in one pass (see rof.sweep)
+# @param demand_r The (realizations x weeks) demand of the policy simulation
+# @param inflow_r The (realizations x weeks) inflow of the policy simulation
+# @param evap_r The (realizations x weeks) evaporation of the policy simulation
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param alphas The ROF triggers to evaluate
+# @param tier The initial storage as a fraction of full capacity, one or one per alpha
+# @param reservoir The reservoir
+# @param restr_factor The fraction of demand met during water restrictions,
+#        one or one per alpha
+# @param restr_weeks The number of weeks a restriction is held for, one or one per alpha
+# @param interpolate If True, interpolate the ROF between tiers
+# @param return_dynamics If True, also return the weekly dynamics
+# @returns the (realizations x alphas) failures and restriction counts,
+#          followed by the (alphas x realizations x weeks) restriction frequency,
+#          restricted demand, storage and short-term risk if return_dynamics is True
+
+@instrument.timed("policy")
+def simulate_restrictions(demand_r, inflow_r, evap_r, rof_tables, alphas, tier, reservoir,
+                          restr_factor=0.8, restr_weeks=4, interpolate=False,
+                          return_dynamics=False):
+    rof_tables = np.asarray(rof_tables, dtype=float)
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    N_reals, n_policy_weeks = demand_r.shape
+    N_alphas = len(alphas)
+    capacity = reservoir.capacity
+    tier = np.broadcast_to(np.asarray(tier, dtype=float), N_alphas)
+    restr_factor = np.broadcast_to(np.asarray(restr_factor, dtype=float), N_alphas)
+    restr_weeks = np.broadcast_to(np.asarray(restr_weeks, dtype=int), N_alphas)
+    # one storage update and one ROF lookup per realization, alpha and week
+    instrument.count("policy_alphas", N_alphas)
+    instrument.count("calc_storage", N_reals*N_alphas*(n_policy_weeks-1))
+    instrument.count("trigger_restriction", N_reals*N_alphas*n_policy_weeks)
+
+    # the compiled loops round the storage up to the next tier only
+    if kernels.use_jit() and not interpolate:
+        return kernels.policy_jit(demand_r, inflow_r, evap_r, rof_tables,
+                                  tier_rows(rof_tables.shape[1]), _tier_bounds, alphas, tier,
+                                  reservoir, restr_factor, restr_weeks, return_dynamics)
+    rows = np.arange(N_reals)[:, None]
+
+    s_t = np.empty((N_reals, N_alphas))
+    s_t[:] = capacity*tier
+    hold = np.zeros((N_reals, N_alphas), dtype=int)
+    rf_count = np.zeros((N_reals, N_alphas), dtype=int)
+    failed = s_t < (reservoir.threshold*capacity)
+    risk = lookup_rof(rof_tables, rows, s_t/capacity, 0, interpolate)
+
+    if return_dynamics:
+        shape = (N_alphas, N_reals, n_policy_weeks)
+        restr_freq = np.zeros(shape, dtype=int)
+        restr_demand = np.zeros(shape, dtype=float)
+        storage_dynamics = np.zeros(shape, dtype=float)
+        short_term_risk = np.zeros(shape, dtype=float)
+        storage_dynamics[:, :, 0] = s_t.T
+        short_term_risk[:, :, 0] = risk.T
+
+    for w in range(1, n_policy_weeks):
+        # a restriction can only be triggered once the previous one has ended
+        restrict = (hold == 0) & (risk > alphas)
+        np.copyto(hold, np.minimum(restr_weeks, n_policy_weeks-w), where=restrict)
+        rf_count += restrict
+        restricted = hold > 0
+
+        d_t = demand_r[:, w-1][:, None]
+        rd_t = np.where(restricted, restr_factor*d_t, d_t)
+        s_t = reservoir.step(s_t, evap_r[:, w-1][:, None], inflow_r[:, w-1][:, None], rd_t)
+        hold[restricted] -= 1
+
+        risk = lookup_rof(rof_tables, rows, s_t/capacity, w, interpolate)
+        # reliability: storage below the failure threshold in any week
+        failed |= s_t < (reservoir.threshold*capacity)
+
+        if return_dynamics:
+            restr_freq[:, :, w-1] = restrict.T
+            restr_demand[:, :, w-1] = rd_t.T
+            storage_dynamics[:, :, w] = s_t.T
+            short_term_risk[:, :, w] = risk.T
+
+    if return_dynamics:
+        return failed, rf_count, restr_freq, restr_demand, storage_dynamics, short_term_risk
+    return failed, rf_count
@@ -0,0 +1,179 @@
+import numpy as np
+from .data_io import load_inputs
+
+# Reservoir and water balance model #################################
+# The water balance shared by the ROF tables, the restriction policy and the
+# hydrology plots:
+#     s_t+1 = s_t - e_t + i_t - d_t, bounded by [0, capacity]
+# and the failure criteria, storage below 20% of capacity.
+
+# Fixed values ######################################################
+reservoir_capacity = 14900*0.5    # Cary's share of Jordan Lake (million gallons)
+failure_threshold = 0.2           # failure: storage below 20% of capacity
+n_weeks = 52
+utility = "Cary"
+
+# Gets the first week of the inflow and evaporation timeseries that lines up
+# with the first week of the policy simulation (one year into the demands)
+# @param n_hydrology_weeks The number of weeks of inflow and evaporation
+# @param n_demand_weeks The number of weeks of demand
+# @param n_weeks The number of weeks in a year
+# @returns the offset into the inflow and evaporation timeseries
+
+def policy_offset(n_hydrology_weeks, n_demand_weeks, n_weeks=n_weeks):
+    return n_hydrology_weeks - n_demand_weeks + n_weeks
+
+class Reservoir:
+    '''A reservoir with a fixed capacity and failure threshold
+
+    The batched methods (step, failed, trajectory) also accept arrays of
+    capacities and thresholds that broadcast against the storages, to step
+    several reservoirs together.
+    '''
+
+    def __init__(self, capacity=reservoir_capacity, threshold=failure_threshold):
+        self.capacity = capacity
+        self.threshold = threshold
+
+    def __repr__(self):
+        return f"Reservoir(capacity={self.capacity!r}, threshold={self.threshold!r})"
+
+    # Calculates the storage at the next timestep
+    # @param s_t The storage at the current timestep
+    # @param e_t The evaporation at the current timestep
+    # @param i_t The inflow at the current timestep
+    # @param d_t The demand at the current timestep
+    # @returns the storage at the next timestep, bounded by [0, capacity]
+
+    def calc_storage(self, s_t, e_t, i_t, d_t):
+        s_tnext = s_t - e_t + i_t - d_t
+        if (s_tnext/self.capacity) >= 1.0:
+            return self.capacity
+        elif s_tnext < 0:
+            return 0.0
+        else:
+            return s_tnext
+
+    # Checks if the storage is lower than the failure threshold
+    # @param st_next The storage at the next timestep
+    # @retuns 1 if failure is detected, 0 otherwise
+
+    def check_failure(self, st_next):
+        if (st_next/self.capacity) < self.threshold:
+            return 1
+        else:
+            return 0
+
+    # Calculates the storage at the next timestep for arrays of storages
+    # Same arithmetic, in the same order, as calc_storage
+    # @param s_t The storages at the current timestep
+    # @param e_t The evaporation at the current timestep
+    # @param i_t The inflow at the current timestep
+    # @param d_t The demand at the current timestep
+    # @param out The array to store the result in; may be s_t
+    # @returns the storages at the next timestep, bounded by [0, capacity]
+
+    def step(self, s_t, e_t, i_t, d_t, out=None):
+        s_tnext = np.subtract(s_t, e_t, out=out)
+        np.add(s_tnext, i_t, out=s_tnext)
+        np.subtract(s_tnext, d_t, out=s_tnext)
+        np.copyto(s_tnext, self.capacity, where=(s_tnext/self.capacity) >= 1.0)
+        np.copyto(s_tnext, 0.0, where=s_tnext < 0)
+        return s_tnext
+
+    # Simulates the storage of several timeseries at once, one week at a time
+    # The weekly update is sequential (the storage is clipped to [0, capacity]
+    # every week), so the loop runs over the weeks and every timeseries is
+    # updated together with step; the results are identical to calc_storage
+    # @param s0 The initial storage, a scalar or one per timeseries
+    # @param evap The (timeseries x weeks) evaporation
+    # @param inflows The (timeseries x weeks) inflows
+    # @param demand The (timeseries x weeks) demand
+    # @returns the (timeseries x weeks) storage, starting from s0
+
+    def trajectory(self, s0, evap, inflows, demand):
+        storage = np.zeros(np.shape(demand))
+        s_t = np.full(storage.shape[0], s0, dtype=float)
+        storage[:,0] = s_t
+        for w in range(1, storage.shape[1]):
+            self.step(s_t, evap[:,w-1], inflows[:,w-1], demand[:,w-1], out=s_t)
+            storage[:,w] = s_t
+        return storage
+
+    # Checks arrays of storages for failure, as check_failure
+    # @param s_t The storages
+    # @param out The boolean array to store the result in
+    # @returns True where failure is detected
+
+    def failed(self, s_t, out=None):
+        return np.less(s_t/self.capacity, self.threshold, out=out)
+
+class WaterBalance:
+    '''The evaporation, inflows and demand of every realization'''
+
+    def __init__(self, evap, inflows, demand, n_weeks=n_weeks):
+        self.evap = evap
+        self.inflows = inflows
+        self.demand = demand
+        self.n_weeks = n_weeks
+
+    # Loads the scaled water balance inputs of a folder
+    # @param path The folder of the water balance files
+    # @param mmap If True, memory-map the .npy files instead of reading them
+    # @returns the water balance
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        evap, inflows, demand = load_inputs(path, mmap)
+        return cls(evap, inflows, demand)
+
+    @property
+    def N_reals(self):
+        return self.demand.shape[0]
+
+    # offset into the inflow and evaporation timeseries of the policy simulation
+    @property
+    def sp(self):
+        return policy_offset(self.inflows.shape[1], self.demand.shape[1], self.n_weeks)
+
+    # historical evaporation and inflows that the ROF tables are based on
+    @property
+    def hist_evap(self):
+        return self.evap[0,:]
+
+    @property
+    def hist_inflows(self):
+        return self.inflows[0,:]
+
+    # Gets the demand, inflow and evaporation of the policy simulation
+    # The first year of demand is only used as the forecast of the ROF tables
+    # @param realizations The realizations to get; all by default
+    # @returns the (realizations x weeks) demand, inflow and evaporation
+
+    def policy_inputs(self, realizations=slice(None)):
+        sp = self.sp
+        return (self.demand[realizations, self.n_weeks:],
+                self.inflows[realizations, sp:],
+                self.evap[realizations, sp:])
+
+    # Simulates the storage of realizations without restrictions
+    # @param reservoir The reservoir
+    # @param s0 The initial storage
+    # @param realizations The realizations to simulate; all by default
+    # @returns the (realizations x weeks) storage
+
+    def baseline_storage(self, reservoir, s0, realizations=slice(None)):
+        demand_r, inflow_r, evap_r = (np.array(x) for x in self.policy_inputs(realizations))
+        return reservoir.trajectory(s0, evap_r, inflow_r, demand_r)
+
+    # Simulates the storage without restrictions block_size realizations at a
+    # time, so only one block of inputs and storage is held in memory
+    # @param reservoir The reservoir
+    # @param s0 The initial storage
+    # @param block_size The number of realizations per block
+    # @returns a generator of (first realization, (block x weeks) storage)
+
+    def baseline_storage_blocks(self, reservoir, s0, block_size=50):
+        for r0 in range(0, self.N_reals, block_size):
+            block = slice(r0, min(r0 + block_size, self.N_reals))
+            yield r0, self.baseline_storage(reservoir, s0, block)
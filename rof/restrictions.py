@@ -0,0 +1,70 @@
+import numpy as np
+
+# Restriction index #################################################
+# The first week of restriction, the number of restrictions and the
+# restriction episodes of every realization and alpha, built from the weekly
+# restriction frequency while the policy is simulated so that analyses of
+# when restrictions happen are a lookup instead of re-reading the weekly
+# dynamics of every alpha.
+#
+# A restriction is triggered in week t (restr_freq[t] = 1) and cuts the demand
+# of weeks t to t + hold - 1, where hold is restr_weeks or the weeks left in
+# the simulation. An episode is a run of consecutive restricted weeks, so a
+# restriction triggered the week after the previous one ends extends it.
+
+# one row per restriction episode; start and end are inclusive policy weeks
+episode_dtype = np.dtype([("realization", np.int64), ("alpha_index", np.int64),
+                          ("start", np.int64), ("end", np.int64)])
+
+# Builds the restriction index of a block of realizations
+# @param restr_freq The (alphas x realizations x weeks) restriction frequency
+# @param restr_weeks The number of weeks a restriction is held for, one or one per alpha
+# @param r0 The first realization of the block
+# @returns the (realizations x alphas) first week of restriction (-1 if there
+#          is none) and restriction count, and the episode table sorted by
+#          realization, alpha and start week
+
+def restriction_index(restr_freq, restr_weeks, r0=0):
+    N_alphas, N_reals, n_policy_weeks = restr_freq.shape
+    # (realizations x alphas x weeks) so that the triggers come out sorted
+    r, a, t = np.nonzero(np.asarray(restr_freq).transpose(1, 0, 2))
+
+    count = np.zeros((N_reals, N_alphas), dtype=np.int64)
+    np.add.at(count, (r, a), 1)
+    first_week = np.full((N_reals, N_alphas), -1, dtype=np.int64)
+    # the first trigger of each (realization, alpha) follows a change of group
+    first = np.ones(len(t), dtype=bool)
+    first[1:] = (r[1:] != r[:-1]) | (a[1:] != a[:-1])
+    first_week[r[first], a[first]] = t[first]
+
+    hold = np.minimum(np.broadcast_to(np.asarray(restr_weeks, dtype=np.int64), N_alphas)[a],
+                      n_policy_weeks - (t + 1))
+    restricted = hold > 0
+    r, a, t, end = r[restricted], a[restricted], t[restricted], (t + hold - 1)[restricted]
+    # a new episode starts unless the previous restriction ended the week before
+    new = np.ones(len(t), dtype=bool)
+    new[1:] = (r[1:] != r[:-1]) | (a[1:] != a[:-1]) | (t[1:] != end[:-1] + 1)
+    starts = np.flatnonzero(new)
+    episodes = np.zeros(len(starts), dtype=episode_dtype)
+    episodes["realization"] = r0 + r[starts]
+    episodes["alpha_index"] = a[starts]
+    episodes["start"] = t[starts]
+    episodes["end"] = end[np.append(starts[1:], len(t)) - 1]
+    return first_week, count, episodes
+
+# Joins the restriction indices of consecutive blocks of realizations
+# @param blocks The (first week, count, episodes) of each block, in order
+# @returns the restriction index of all the realizations
+
+def join_restriction_index(blocks):
+    first_week, count, episodes = zip(*blocks)
+    return np.concatenate(first_week), np.concatenate(count), np.concatenate(episodes)
+
+# Gets the episodes of one realization and alpha from an episode table
+# @param episodes The episode table
+# @param r The realization
+# @param a The index of the alpha
+# @returns the episodes of realization r and alpha a
+
+def realization_episodes(episodes, r, a):
+    return episodes[(episodes["realization"] == r) & (episodes["alpha_index"] == a)]
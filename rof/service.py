@@ -0,0 +1,212 @@
+import numpy as np
+from collections import OrderedDict
+from .reservoir import n_weeks
+from .tables import tiers
+from .engine import _simulations_fail
+from . import instrument
+
+# Real-time ROF queries #############################################
+# Answers "what is the ROF of this storage in this week with this demand
+# forecast?" without generating a ROF table. A query is one entry of a ROF
+# table: n_hist_years ROF simulations of one year, starting at the storage,
+# driven by the demand forecast of the next n_weeks weeks and by the
+# historical hydrology of week w of each historical year (see
+# engine.rof_table). The hydrology windows of every start week are set up
+# once as (start weeks x historical years x weeks) strided views of the
+# historical timeseries, without copying them, and a batch of queries is
+# simulated together, one week at a time, like the tiers of rof_table.
+#
+# Queries are answered either from the ROF of the storage tiers (the storage
+# is rounded up to the next tier at or above it), whose columns are found by
+# bisection, as in adaptive mode, and cached per (week, demand forecast) so
+# that repeated queries of the same week are a lookup, or exactly, by simulating the storage itself, which is what a
+# storage between two tiers needs. Both give the same results as rof_table,
+# bit for bit, at the tiers.
+
+class RofService:
+    '''Answers single or batched ROF queries against the historical hydrology'''
+
+    def __init__(self, evap_timeseries, inflow_timeseries, reservoir, n_hist_years,
+                 tiers=tiers, n_weeks=n_weeks, cache_size=256):
+        self.reservoir = reservoir
+        self.n_hist_years = n_hist_years
+        self.n_weeks = n_weeks
+        self.tiers = np.sort(np.asarray(tiers, dtype=float))
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.evap_timeseries = np.ascontiguousarray(evap_timeseries, dtype=float)
+        self.inflow_timeseries = np.ascontiguousarray(inflow_timeseries, dtype=float)
+        self.evap_windows = self._windows(self.evap_timeseries)
+        self.inflow_windows = self._windows(self.inflow_timeseries)
+
+    # Makes a service from the historical hydrology of a water balance
+    # @param water_balance The water balance
+    # @param reservoir The reservoir
+    # @param n_hist_years The number of historical years (ROF simulations) per query
+    # @param tiers The storage tiers as fractions of full capacity
+    # @param cache_size The number of (week, demand forecast) tier columns kept
+    # @returns the service
+
+    @classmethod
+    def from_water_balance(cls, water_balance, reservoir, n_hist_years, tiers=tiers,
+                           cache_size=256):
+        return cls(water_balance.hist_evap, water_balance.hist_inflows, reservoir, n_hist_years,
+                   tiers, water_balance.n_weeks, cache_size)
+
+    def __repr__(self):
+        return (f"RofService(n_hist_years={self.n_hist_years!r}, n_starts={self.n_starts!r}, "
+                f"n_tiers={len(self.tiers)!r}, cache_size={self.cache_size!r})")
+
+    # Gets the hydrology windows of every start week as a strided view
+    # @param timeseries The historical timeseries
+    # @returns the (start weeks x historical years x weeks) windows
+
+    def _windows(self, timeseries):
+        n_starts = len(timeseries) - self.n_hist_years*self.n_weeks + 1
+        if n_starts < 1:
+            raise ValueError(f"{len(timeseries)} weeks of hydrology are too few for "
+                             f"{self.n_hist_years} historical years")
+        step = timeseries.strides[0]
+        return np.lib.stride_tricks.as_strided(
+            timeseries, shape=(n_starts, self.n_hist_years, self.n_weeks),
+            strides=(step, step*self.n_weeks, step), writeable=False)
+
+    # The number of weeks that can be queried
+    @property
+    def n_starts(self):
+        return self.evap_windows.shape[0]
+
+    # Checks that weeks can be queried
+    # @param weeks The weeks, sorted
+    def _check_weeks(self, weeks):
+        if len(weeks) and (weeks[0] < 0 or weeks[-1] >= self.n_starts):
+            raise ValueError(f"weeks must be in [0, {self.n_starts}), got {weeks[0]} to "
+                             f"{weeks[-1]}")
+
+    # Simulates the ROF of a batch of queries
+    # @param storage The storage of each query
+    # @param weeks The week of each query
+    # @param demand_years The (queries x n_weeks) demand forecast of each query
+    # @returns the ROF of each query
+
+    def simulate(self, storage, weeks, demand_years):
+        starts, query_start = np.unique(weeks, return_inverse=True)
+        self._check_weeks(starts)
+        # gather the windows of each distinct week once
+        evap = self.evap_windows[starts]
+        inflow = self.inflow_windows[starts]
+
+        s_t = np.repeat(np.asarray(storage, dtype=float)[:, None], self.n_hist_years, axis=1)
+        failed = np.zeros(s_t.shape, dtype=bool)
+        fail_t = np.empty(s_t.shape, dtype=bool)
+        instrument.count("rof_simulations", s_t.size)
+        for d in range(self.n_weeks):
+            if instrument.enabled():
+                instrument.count("calc_storage", s_t.size - np.count_nonzero(failed))
+            self.reservoir.step(s_t, evap[query_start, :, d], inflow[query_start, :, d],
+                                demand_years[:, d][:, None], out=s_t)
+            self.reservoir.failed(s_t, out=fail_t)
+            np.logical_or(failed, fail_t, out=failed)
+            if failed.all():
+                break
+        return np.count_nonzero(failed, axis=1) / self.n_hist_years
+
+    # Simulates the ROF of every tier of several (week, demand forecast)
+    # columns. As in engine.rof_table_adaptive, a ROF simulation that survives
+    # from one tier survives from every higher tier, so the transition tier of
+    # each (column, historical year) simulation is found by bisection
+    # @param weeks The week of each column
+    # @param demand_years The (columns x n_weeks) demand forecast of each column
+    # @returns the (columns x tiers) ROF
+
+    def _simulate_tiers(self, weeks, demand_years):
+        self._check_weeks(np.sort(weeks))
+        n_columns, n_tiers = len(weeks), len(self.tiers)
+        storage_tier = self.tiers*self.reservoir.capacity
+        demand_starts = np.repeat(np.arange(n_columns)*self.n_weeks, self.n_hist_years)
+        hist_starts = (np.repeat(weeks, self.n_hist_years)
+                       + self.n_weeks*np.tile(np.arange(self.n_hist_years), n_columns))
+
+        # every simulation fails from the tiers below lo and survives from hi up
+        lo = np.zeros(len(demand_starts), dtype=np.int64)
+        hi = np.full(len(demand_starts), n_tiers, dtype=np.int64)
+        active = np.arange(len(demand_starts))
+        while len(active) > 0:
+            mid = (lo[active] + hi[active]) // 2
+            fails = _simulations_fail(storage_tier[mid], demand_starts[active], hist_starts[active],
+                                      demand_years.reshape(-1), self.evap_timeseries,
+                                      self.inflow_timeseries, self.reservoir, self.n_weeks)
+            lo[active[fails]] = mid[fails] + 1
+            hi[active[~fails]] = mid[~fails]
+            active = active[lo[active] < hi[active]]
+
+        n_failing = lo.reshape(n_columns, self.n_hist_years)
+        fail_count = np.count_nonzero(n_failing[:, :, None] > np.arange(n_tiers), axis=1)
+        return fail_count / self.n_hist_years
+
+    # Gets the ROF of every storage tier for several (week, demand forecast)
+    # columns, keeping the cache_size most recently used columns in memory.
+    # The columns that are not cached are simulated together
+    # @param weeks The week of each column
+    # @param demand_years The (columns x n_weeks) demand forecast of each column
+    # @returns the (columns x tiers) ROF, the tiers in increasing order of storage
+
+    def tier_rof(self, weeks, demand_years):
+        demand_years = np.ascontiguousarray(demand_years, dtype=float)
+        keys = [(int(w), d.tobytes()) for w, d in zip(weeks, demand_years)]
+        missing = [c for c, key in enumerate(keys) if key not in self._cache]
+        n_tiers = len(self.tiers)
+        fresh = {}
+        if missing:
+            rof = self._simulate_tiers(np.asarray(weeks, dtype=np.int64)[missing],
+                                       demand_years[missing])
+            fresh = dict(zip((keys[c] for c in missing), rof))
+
+        columns = np.empty((len(keys), n_tiers))
+        for c, key in enumerate(keys):
+            if key in fresh:
+                columns[c] = fresh[key]
+            else:
+                self._cache.move_to_end(key)
+                columns[c] = self._cache[key]
+        if self.cache_size > 0:
+            self._cache.update(fresh)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return columns
+
+    # Answers single or batched ROF queries
+    # @param storage The current storage, one or one per query
+    # @param week The week, one or one per query
+    # @param demand_year The demand forecast of the next n_weeks weeks, one
+    #        (n_weeks) or one per query (queries x n_weeks)
+    # @param exact If True, simulate the storage itself; else round it up to
+    #        the next tier and read the ROF of that tier
+    # @returns the ROF of each query, a scalar for a single query
+
+    @instrument.timed("rof_query")
+    def rof(self, storage, week, demand_year, exact=False):
+        demand_year = np.asarray(demand_year, dtype=float)
+        if demand_year.shape[-1] != self.n_weeks:
+            raise ValueError(f"a demand forecast has {self.n_weeks} weeks, got "
+                             f"{demand_year.shape[-1]}")
+        single = np.ndim(storage) == 0 and np.ndim(week) == 0 and demand_year.ndim == 1
+        n_queries = np.broadcast_shapes(np.shape(storage), np.shape(week),
+                                        demand_year.shape[:-1], (1,))[0]
+        storage = np.broadcast_to(np.asarray(storage, dtype=float), n_queries)
+        weeks = np.broadcast_to(np.asarray(week, dtype=np.int64), n_queries)
+        demand_years = np.broadcast_to(demand_year, (n_queries, self.n_weeks))
+
+        if exact:
+            rof = self.simulate(storage, weeks, demand_years)
+        else:
+            # the next tier at or above each storage
+            frac = storage/self.reservoir.capacity
+            tier = np.minimum(np.searchsorted(self.tiers, frac, side="left"), len(self.tiers) - 1)
+            # one column of tiers per distinct (week, demand forecast)
+            columns, query_column = np.unique(
+                np.column_stack([weeks, np.ascontiguousarray(demand_years).view(np.int64)]),
+                axis=0, return_inverse=True)
+            column_rof = self.tier_rof(columns[:, 0], columns[:, 1:].view(float))
+            rof = column_rof[query_column.reshape(-1), tier]
+        return rof[0] if single else rof
@@ -0,0 +1,139 @@
+import numpy as np
+import itertools
+from multiprocessing import Pool
+from .policy import simulate_restrictions
+from .parallel import _worker, _init_worker, share_arrays, release_arrays
+from . import instrument
+
+# Policy scenario sweep #############################################
+# A scenario is one variant of the restriction policy: the initial storage
+# tier, the ROF trigger alpha, the fraction of demand met during restrictions
+# and the number of weeks a restriction is held for. simulate_restrictions
+# takes these per alpha, so a chunk of scenarios runs in one pass over the
+# weeks, exactly like the alpha sweep of tradeoff.py. Chunks are spread
+# across a process pool; the policy inputs and the ROF tables are copied once
+# into shared memory and mapped by every worker with the helpers of rof.parallel.
+
+# one row per scenario
+scenario_dtype = np.dtype([("tier", float), ("alpha", float),
+                           ("restr_factor", float), ("restr_weeks", np.int64)])
+# one row per scenario, with its results
+result_dtype = np.dtype(scenario_dtype.descr + [("reliability", float), ("restr_freq", float)])
+
+# Makes the scenarios of every combination of the parameters
+# @param tiers The initial storage tiers
+# @param alphas The ROF triggers
+# @param restr_factors The fractions of demand met during water restrictions
+# @param restr_weeks The numbers of weeks a restriction is held for
+# @returns the scenario table
+
+def grid_scenarios(tiers=(1.0,), alphas=(0.01,), restr_factors=(0.8,), restr_weeks=(4,)):
+    grid = list(itertools.product(tiers, alphas, restr_factors, restr_weeks))
+    return np.array(grid, dtype=scenario_dtype)
+
+# Makes a Latin hypercube sample of scenarios: each range is split into
+# n_scenarios equal strata and every stratum is sampled exactly once
+# @param n_scenarios The number of scenarios
+# @param tier The (low, high) range of the initial storage tier
+# @param alpha The (low, high) range of the ROF trigger
+# @param restr_factor The (low, high) range of the fraction of demand met
+# @param restr_weeks The (low, high) range of the restriction weeks, inclusive
+# @param seed The random seed
+# @returns the scenario table
+
+def latin_hypercube_scenarios(n_scenarios, tier=(0.2, 1.0), alpha=(0.0, 0.2),
+                              restr_factor=(0.6, 1.0), restr_weeks=(1, 8), seed=0):
+    rng = np.random.default_rng(seed)
+    scenarios = np.zeros(n_scenarios, dtype=scenario_dtype)
+    for name, (low, high) in (("tier", tier), ("alpha", alpha), ("restr_factor", restr_factor),
+                              ("restr_weeks", restr_weeks)):
+        u = (rng.permutation(n_scenarios) + rng.random(n_scenarios))/n_scenarios
+        if name == "restr_weeks":
+            scenarios[name] = low + np.floor(u*(high - low + 1)).astype(np.int64)
+        else:
+            scenarios[name] = low + u*(high - low)
+    return scenarios
+
+# Simulates one chunk of scenarios
+# @param inputs The demand, inflow and evaporation of the policy simulation and the ROF tables
+# @param scenarios The scenario table of the chunk
+# @param reservoir The reservoir
+# @param interpolate If True, interpolate the ROF between tiers
+# @returns the reliability and average restriction frequency of each scenario
+
+def _simulate_chunk(inputs, scenarios, reservoir, interpolate):
+    demand_r, inflow_r, evap_r, rof_tables = inputs
+    failed, rf_count = simulate_restrictions(demand_r, inflow_r, evap_r, rof_tables,
+                                             scenarios["alpha"], scenarios["tier"], reservoir,
+                                             scenarios["restr_factor"], scenarios["restr_weeks"],
+                                             interpolate)
+    N_reals = demand_r.shape[0]
+    return 1.0 - (failed.sum(axis=0)/N_reals), rf_count.sum(axis=0)/N_reals
+
+# Simulates one chunk of scenarios in a worker process
+# @param task The (first scenario, scenario table) of the chunk
+# @returns the first scenario, the results of the chunk and the
+#          instrumentation counts of the task
+
+def _sweep_chunk(task):
+    i0, scenarios = task
+    reservoir, interpolate = _worker['settings']
+    instrument.reset()
+    results = _simulate_chunk(_worker['inputs'], scenarios, reservoir, interpolate)
+    return i0, results, instrument.snapshot()
+
+# Simulates every scenario for the first N_reals realizations
+# @param water_balance The water balance
+# @param rof_tables The (realizations x tiers x weeks) ROF tables
+# @param reservoir The reservoir
+# @param scenarios The scenario table (see grid_scenarios, latin_hypercube_scenarios)
+# @param n_workers The number of worker processes; 1 runs in this process
+# @param chunk_size The number of scenarios simulated together
+# @param interpolate If True, interpolate the ROF between tiers
+# @returns the result table, one row per scenario in the order given
+
+def run_sweep(water_balance, rof_tables, reservoir, scenarios, n_workers=1, chunk_size=64,
+              interpolate=False):
+    rof_tables = np.asarray(rof_tables, dtype=float)
+    N_reals = rof_tables.shape[0]
+    inputs = [np.ascontiguousarray(x, dtype=float)
+              for x in water_balance.policy_inputs(slice(0, N_reals))] + [rof_tables]
+    tasks = [(i0, scenarios[i0:i0+chunk_size]) for i0 in range(0, len(scenarios), chunk_size)]
+
+    results = np.zeros(len(scenarios), dtype=result_dtype)
+    for name in scenario_dtype.names:
+        results[name] = scenarios[name]
+
+    progress = instrument.Progress(len(scenarios))
+    if n_workers <= 1:
+        for i0, chunk in tasks:
+            reliability, restr_freq = _simulate_chunk(inputs, chunk, reservoir, interpolate)
+            results["reliability"][i0:i0+len(chunk)] = reliability
+            results["restr_freq"][i0:i0+len(chunk)] = restr_freq
+            progress.update(len(chunk))
+            print("scenarios: ", progress)
+        return results
+
+    shms, specs = share_arrays(inputs)
+    try:
+        with Pool(n_workers, initializer=_init_worker,
+                  initargs=(specs, (reservoir, interpolate))) as pool:
+            for i0, (reliability, restr_freq), stats in pool.imap_unordered(_sweep_chunk, tasks):
+                instrument.merge(stats)
+                results["reliability"][i0:i0+len(reliability)] = reliability
+                results["restr_freq"][i0:i0+len(restr_freq)] = restr_freq
+                progress.update(len(reliability))
+                print("scenarios: ", progress)
+    finally:
+        release_arrays(shms)
+    return results
+
+# Writes a result table to a CSV file with a header
+# @param file_name The file name
+# @param results The result table
+
+@instrument.timed("write_sweep")
+def save_sweep(file_name, results):
+    np.savetxt(file_name, results, delimiter=",",
+               fmt=["%.10g", "%.10g", "%.10g", "%d", "%.10g", "%.10g"],
+               header=",".join(results.dtype.names), comments="")
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Synthetic inputs ##################################################
+# Seeded generators with the same shapes, units and rough magnitudes as the
+# scaled water balance files (26 years of demand, 98 years of inflows and
+# evaporation, million gallons/week), for benchmarks and for checking the
+# simulation without the full data set.
+
+n_weeks = 52
+
+# Gets a weekly seasonal cycle
+# @param n The number of weeks
+# @param phase The week of the peak
+# @returns the cycle, between -1 and 1
+
+def _season(n, phase):
+    return np.cos(2*np.pi*(np.arange(n) - phase)/n_weeks)
+
+# Generates synthetic weekly demands with a summer peak and a yearly growth
+# @param N_reals The number of realizations
+# @param n_years The number of years
+# @param seed The random seed
+# @returns the (realizations x weeks) demand
+
+def synthetic_demand(N_reals, n_years=26, seed=0):
+    rng = np.random.default_rng(seed)
+    n = n_years*n_weeks
+    growth = 1.0 + 0.01*np.arange(n)/n_weeks
+    base = 160.0*growth*(1.0 + 0.15*_season(n, 30))
+    return base*rng.normal(1.0, 0.05, (N_reals, n))
+
+# Generates synthetic weekly inflows with a wet winter and lognormal noise
+# @param N_reals The number of realizations
+# @param n_years The number of years
+# @param seed The random seed
+# @returns the (realizations x weeks) inflows
+
+def synthetic_inflows(N_reals, n_years=98, seed=1):
+    rng = np.random.default_rng(seed)
+    n = n_years*n_weeks
+    log_mean = np.log(130.0) + 0.8*_season(n, 8)
+    return np.exp(log_mean + rng.normal(0.0, 0.9, (N_reals, n)))
+
+# Generates synthetic weekly evaporation with a summer peak
+# @param N_reals The number of realizations
+# @param n_years The number of years
+# @param seed The random seed
+# @returns the (realizations x weeks) evaporation
+
+def synthetic_evap(N_reals, n_years=98, seed=2):
+    rng = np.random.default_rng(seed)
+    n = n_years*n_weeks
+    base = 30.0*(1.0 + 0.8*_season(n, 28))
+    return np.maximum(base + rng.normal(0.0, 5.0, (N_reals, n)), 0.0)
+
+# Generates a synthetic SSI6-like drought index, an AR(1) process with unit
+# variance and the persistence of a 24-week rolling mean
+# @param N_reals The number of realizations
+# @param n The number of weeks
+# @param seed The random seed
+# @returns the (realizations x weeks) index
+
+def synthetic_ssi6(N_reals, n, seed=3, phi=0.95):
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0.0, np.sqrt(1 - phi**2), (N_reals, n))
+    ssi6 = np.zeros((N_reals, n))
+    ssi6[:, 0] = rng.normal(0.0, 1.0, N_reals)
+    for w in range(1, n):
+        ssi6[:, w] = phi*ssi6[:, w-1] + noise[:, w]
+    return ssi6
+
+# Generates synthetic ROF tables that, like real ones, never increase with
+# storage and are multiples of 1/N_rofs
+# @param N_reals The number of realizations
+# @param n_rof_weeks The number of weeks of each table
+# @param n_tiers The number of storage tiers
+# @param N_rofs The number of ROF simulations per entry
+# @param seed The random seed
+# @returns the (realizations x tiers x weeks) ROF tables
+
+def synthetic_rof_tables(N_reals, n_rof_weeks, n_tiers=21, N_rofs=50, seed=4):
+    rng = np.random.default_rng(seed)
+    rof = np.sort(rng.beta(0.5, 3.0, (N_reals, n_rof_weeks, n_tiers)), axis=2)[:, :, ::-1]
+    return np.round(rof*N_rofs).transpose(0, 2, 1)/N_rofs
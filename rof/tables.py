@@ -0,0 +1,95 @@
+import numpy as np
+import os
+from .cache import (rof_table_key, rof_table_file, rof_table_files, is_cached, save_rof_table,
+                    stacked_tables_file, table_stamps, stack_covers, remove_key, write_key)
+from .parallel import generate_rof_tables
+from . import instrument
+
+# ROF table files ###################################################
+# rof_table_generator.py writes one CSV per realization. load_tables stacks
+# them once into a single (realizations x tiers x weeks) .npy file that is
+# memory-mapped on every later load, so a sweep only reads the entries it
+# looks up instead of parsing every CSV again.
+
+tiers = np.arange(0.0, 1.05, 0.05)      # storage tiers from 0% to 100% in increments of 5%
+
+# Generates the ROF tables of the first N_reals realizations into a folder
+# Tables that are already up to date are skipped and every other table is
+# written as soon as it is completed
+# @param water_balance The water balance
+# @param reservoir The reservoir
+# @param path The folder in which the ROF tables are stored
+# @param utility The name of the utility
+# @param N_reals The number of realizations
+# @param N_rofs The number of historical years (ROF simulations) per entry
+# @param tiers The storage tiers as fractions of full capacity
+# @param n_workers The number of worker processes; 1 runs in this process
+# @param adaptive If True, bisect for the transition tier of every ROF
+#                 simulation (same tables, fewer simulations)
+# @returns the realizations whose tables were generated
+
+def generate_tables(water_balance, reservoir, path, utility, N_reals, N_rofs,
+                    tiers=tiers, n_workers=1, adaptive=False):
+    n_weeks = water_balance.n_weeks
+    demand = water_balance.demand
+    evap_timeseries = water_balance.hist_evap
+    inflow_timeseries = water_balance.hist_inflows
+
+    # Skip the realizations whose tables are already up to date ########
+    keys = [rof_table_key(demand[r,:], evap_timeseries, inflow_timeseries, tiers,
+                          reservoir, N_rofs, n_weeks)
+            for r in range(N_reals)]
+    pending = [r for r in range(N_reals) if not is_cached(rof_table_file(path, utility, r), keys[r])]
+    print(N_reals - len(pending), " of ", N_reals, " ROF tables up to date")
+    progress = instrument.Progress(len(pending))
+
+    # All tiers, weeks and historical years of a realization are simulated at once,
+    # and realizations are spread across n_workers processes
+    for i, rof_table_r in generate_rof_tables(demand[pending,:], evap_timeseries, inflow_timeseries,
+                                              tiers, reservoir, N_rofs, n_weeks,
+                                              n_workers=n_workers, adaptive=adaptive):
+        r = pending[i]
+        progress.update()
+        print("realization = ", r, " completed (", progress, ")")
+        save_rof_table(rof_table_file(path, utility, r), rof_table_r, keys[r])
+    return pending
+
+# Stacks the ROF table CSVs into one .npy file, one realization at a time
+# @param files The ROF table files, indexed by realization
+# @param file_name The file name of the stacked tables
+# @param stamps The stamps of the table files
+
+def stack_tables(files, file_name, stamps):
+    remove_key(file_name)
+    first = np.loadtxt(files[0], delimiter=",", ndmin=2)
+    stack = np.lib.format.open_memmap(file_name + ".tmp", mode="w+", dtype=float,
+                                      shape=(len(files),) + first.shape)
+    stack[0] = first
+    for r in range(1, len(files)):
+        stack[r] = np.loadtxt(files[r], delimiter=",", ndmin=2)
+    stack.flush()
+    del stack
+    os.replace(file_name + ".tmp", file_name)
+    write_key(file_name, "\n".join(stamps))
+
+# Loads the ROF tables of the first N_reals realizations
+# The tables are stacked into a .npy file the first time, whenever a table
+# file changes and when more realizations are needed, and the stack is
+# memory-mapped
+# @param path The folder in which the ROF tables are stored
+# @param utility The name of the utility
+# @param N_reals The number of realizations
+# @param mmap If True, memory-map the stacked tables; otherwise parse the CSVs
+# @returns the (realizations x tiers x weeks) ROF tables
+
+@instrument.timed("load_tables")
+def load_tables(path, utility, N_reals, mmap=True):
+    files = rof_table_files(path, utility, N_reals)
+    if not mmap:
+        return np.stack([np.loadtxt(f, delimiter=",") for f in files])
+    file_name = stacked_tables_file(path, utility)
+    stamps = table_stamps(files)
+    if not stack_covers(file_name, stamps):
+        print("stacking ", N_reals, " ROF tables into ", file_name)
+        stack_tables(files, file_name, stamps)
+    return np.load(file_name, mmap_mode="r")[:N_reals]
@@ -0,0 +1,93 @@
+import numpy as np
+from .reservoir import Reservoir, WaterBalance, failure_threshold, n_weeks
+from .policy import simulate_restrictions
+
+# Several utilities sharing a reservoir #############################
+# Each utility owns an allocation of the shared reservoir: a fraction of its
+# inflows and evaporation and its own storage capacity, failure threshold,
+# demand and ROF tables, as in the allocation accounts of Jordan Lake. The
+# accounts do not exchange water, so the water balance and the restriction
+# policy of every utility follow the single-utility model; they are stepped
+# together by stacking the (utility, realization) pairs into one axis, with
+# the capacity and threshold of each pair broadcast against it. A run over
+# N utilities costs one pass over the weeks instead of N script runs.
+#
+# A single utility with an allocation of 1 gives the same results as
+# simulate_policy.
+
+class Utility:
+    '''A utility supplied by an allocation of a shared reservoir'''
+
+    def __init__(self, name, demand, capacity, allocation=1.0, threshold=failure_threshold):
+        self.name = name
+        self.demand = demand
+        self.capacity = capacity
+        self.allocation = allocation
+        self.threshold = threshold
+
+    def __repr__(self):
+        return (f"Utility(name={self.name!r}, capacity={self.capacity!r}, "
+                f"allocation={self.allocation!r}, threshold={self.threshold!r})")
+
+    @property
+    def reservoir(self):
+        return Reservoir(self.capacity, self.threshold)
+
+    # Gets the water balance of the utility's allocation
+    # The ROF tables of the utility are generated from it with generate_tables
+    # @param evap The (realizations x weeks) evaporation of the shared reservoir
+    # @param inflows The (realizations x weeks) inflows of the shared reservoir
+    # @param n_weeks The number of weeks in a year
+    # @returns the water balance of the utility
+
+    def water_balance(self, evap, inflows, n_weeks=n_weeks):
+        if self.allocation != 1.0:
+            evap = self.allocation*np.asarray(evap)
+            inflows = self.allocation*np.asarray(inflows)
+        return WaterBalance(evap, inflows, self.demand, n_weeks)
+
+# Simulates the restriction policy of every utility, realization and alpha
+# @param utilities The utilities sharing the reservoir
+# @param evap The (realizations x weeks) evaporation of the shared reservoir
+# @param inflows The (realizations x weeks) inflows of the shared reservoir
+# @param rof_tables The (realizations x tiers x weeks) ROF tables of each utility
+# @param alphas The ROF triggers to evaluate
+# @param tier The initial storage as a fraction of full capacity
+# @param restr_factor The fraction of demand met during water restrictions
+# @param restr_weeks The number of weeks a restriction is held for
+# @param interpolate If True, interpolate the ROF between tiers
+# @param return_dynamics If True, also return the weekly dynamics
+# @returns the (utilities x alphas) reliability and average restriction
+#          frequency, followed by the (utilities x alphas x realizations x weeks)
+#          restriction frequency, restricted demand, storage and short-term
+#          risk if return_dynamics is True
+
+def simulate_utilities(utilities, evap, inflows, rof_tables, alphas, tier,
+                       restr_factor=0.8, restr_weeks=4, interpolate=False,
+                       return_dynamics=False):
+    if len(utilities) != len(rof_tables):
+        raise ValueError(f"{len(utilities)} utilities but {len(rof_tables)} sets of ROF tables")
+    rof_tables = [np.asarray(t, dtype=float) for t in rof_tables]
+    N_reals = rof_tables[0].shape[0]
+    if any(t.shape != rof_tables[0].shape for t in rof_tables):
+        raise ValueError("the ROF tables of every utility must have the same shape")
+    N_utilities = len(utilities)
+
+    # stack the policy inputs of every utility along the realization axis
+    inputs = [u.water_balance(evap, inflows).policy_inputs(slice(0, N_reals)) for u in utilities]
+    demand_r, inflow_r, evap_r = (np.concatenate(x) for x in zip(*inputs))
+    capacity = np.repeat([float(u.capacity) for u in utilities], N_reals)[:, None]
+    threshold = np.repeat([float(u.threshold) for u in utilities], N_reals)[:, None]
+
+    out = simulate_restrictions(demand_r, inflow_r, evap_r, np.concatenate(rof_tables),
+                                alphas, tier, Reservoir(capacity, threshold),
+                                restr_factor, restr_weeks, interpolate, return_dynamics)
+
+    failed = out[0].reshape(N_utilities, N_reals, -1)
+    rf_count = out[1].reshape(N_utilities, N_reals, -1)
+    reliability = 1.0 - (failed.sum(axis=1)/N_reals)
+    rf_avg = rf_count.sum(axis=1)/N_reals
+    # (alphas x utility-realizations x weeks) -> (utilities x alphas x realizations x weeks)
+    dynamics = tuple(x.reshape(x.shape[0], N_utilities, N_reals, -1).swapaxes(0, 1)
+                     for x in out[2:])
+    return (reliability, rf_avg) + dynamics
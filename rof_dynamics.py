@@ -1,62 +1,75 @@
 import numpy as np
-import random
 import matplotlib.pyplot as plt
 import seaborn as sns
-import glob
 import os
-import pandas as pd
-
-sns.set_theme()
-sns.set_style("white")
-# Get the ROF tables ################################################
-rf_data = []
-for each_file in glob.glob('C:/Users/lilli/Desktop/Risk-of-Failure/dynamics/restr_freq/restr_freq_*.csv'):
-    rf_data.append(each_file)
-# Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
-# Modify filenames and locations depending on test case ############
-cwd = os.getcwd()
-rf_filename = cwd + "/dynamics/restr_freq/restr_freq_1.0_0.05.csv"
-rof_filename = cwd + "/dynamics/short_term_risk/risk_1.0_0.05.csv"
-restr_freq = np.loadtxt(rf_filename, delimiter = ",")
-rof = np.loadtxt(rof_filename, delimiter=",")
-years= np.arange(0,2340,1)
-r = 0
-
-alpha = np.arange(0.0, 0.21, 0.01)
-rf_r = restr_freq[r,:]
-rof_r = rof[r,:]*100
-
-restriction_year = np.zeros(len(alpha), dtype=int)
-for i in range(len(alpha)):
-    rf_alpha = np.loadtxt(rf_data[i], delimiter=",")
-    rf_alpha_r = rf_alpha[r,:]
-    first_restriction = np.nonzero(rf_alpha_r)
-    restriction_year[i] =years[first_restriction][0]
-
-inflow_file = cwd + "\water_balance_files\jordan_lake_inflows.csv"
-demand_file = cwd + "\water_balance_files\cary_demand.csv"
-
-inflows = 0.20*np.loadtxt(inflow_file, delimiter=",")
-demand = 1.1*np.loadtxt(demand_file, delimiter=",")
-sp = inflows.shape[1] - demand.shape[1] + 52
-
-fig, ax = plt.subplots(figsize=(8,4))
-y_pos = np.arange(len(alpha))
-weeks = np.arange(0,90,1)
-week_ticks = np.arange(0,95,5)
-week_labels = week_ticks.astype(str)
-ax.barh(y_pos, restriction_year, align='center', color="plum", label="First restriction")
-ax.set_yticks(np.arange(0,25,5))
-ax.set_yticklabels(np.arange(0,25,5).astype(str))
-ax.set_xlabel('Week of first restriction')
-ax.set_ylabel(r"$\alpha$ (%)")
-ax.set_title('First water restriction implementation')
-
-ax2=ax.twinx()
-ax2.plot(weeks, inflows[0,sp:sp+90], label="Inflow (BG)", linewidth=1.2)
-ax2.set_ylabel("Inflow (BG)")
-
-handles, labels = [(a + b) for a, b in zip(ax.get_legend_handles_labels(), ax2.get_legend_handles_labels())]
-plt.legend(handles, labels, loc = "lower right", fontsize=12)
-#plt.savefig("Figures/first_restriction_r0.png")
-plt.show()
+from rof import load_input, load_dynamics, load_restriction_index, policy_offset
+from rof.data_io import restriction_index_file
+
+# Plots the week of the first water restriction of one realization for every
+# ROF trigger alpha, against the inflows of the first weeks.
+
+# Gets the week of the first restriction of one or more realizations for
+# every alpha. The restriction index written by tradeoff.py is used if it
+# covers the alphas, else the restriction frequency of each alpha is read
+# @param dynamics_path The dynamics folder written by tradeoff.py
+# @param tier The initial storage as a fraction of full capacity
+# @param alpha The ROF triggers
+# @param r The realization, or an array of realizations
+# @returns the week of the first restriction of each alpha (-1 if there is
+#          none), one row per realization if r is an array
+
+def first_restriction_weeks(dynamics_path, tier, alpha, r=0):
+    if os.path.exists(restriction_index_file(dynamics_path, tier)):
+        index_alphas, first_week, count, episodes = load_restriction_index(dynamics_path, tier)
+        matches = np.isclose(np.asarray(alpha)[:, None], index_alphas[None, :])
+        if matches.any(axis=1).all():
+            return first_week[r][..., matches.argmax(axis=1)]
+    restriction_year = []
+    for i in range(len(alpha)):
+        # only realizations r are read and decoded, whichever format tradeoff.py wrote
+        rf_alpha_r = np.asarray(load_dynamics(dynamics_path, "restr_freq", tier, alpha[i], r)) != 0
+        restriction_year.append(np.where(rf_alpha_r.any(axis=-1), rf_alpha_r.argmax(axis=-1), -1))
+    return np.stack(restriction_year, axis=-1)
+
+# Plots the week of the first restriction of each alpha with the inflows
+def plot_first_restriction(restriction_year, alpha, inflow_r):
+    sns.set_theme()
+    sns.set_style("white")
+    fig, ax = plt.subplots(figsize=(8,4))
+    y_pos = np.arange(len(alpha))
+    weeks = np.arange(0,90,1)
+    ax.barh(y_pos, restriction_year, align='center', color="plum", label="First restriction")
+    ax.set_yticks(np.arange(0,25,5))
+    ax.set_yticklabels(np.arange(0,25,5).astype(str))
+    ax.set_xlabel('Week of first restriction')
+    ax.set_ylabel(r"$\alpha$ (%)")
+    ax.set_title('First water restriction implementation')
+
+    ax2=ax.twinx()
+    ax2.plot(weeks, inflow_r[:90], label="Inflow (BG)", linewidth=1.2)
+    ax2.set_ylabel("Inflow (BG)")
+
+    handles, labels = [(a + b) for a, b in zip(ax.get_legend_handles_labels(), ax2.get_legend_handles_labels())]
+    plt.legend(handles, labels, loc = "lower right", fontsize=12)
+    return fig
+
+def main():
+    # Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
+    # Modify filenames and locations depending on test case ############
+    cwd = os.getcwd()
+    dynamics_path = cwd + "/dynamics/"
+    r = 0
+    tier = 1.0
+    alpha = np.arange(0.0, 0.21, 0.01)
+
+    restriction_year = first_restriction_weeks(dynamics_path, tier, alpha, r)
+
+    inflows = load_input(cwd + "/water_balance_files/", "inflows")
+    demand = load_input(cwd + "/water_balance_files/", "demand")
+    sp = policy_offset(inflows.shape[1], demand.shape[1])
+    plot_first_restriction(restriction_year, alpha, inflows[r,sp:])
+    #plt.savefig("Figures/first_restriction_r0.png")
+    plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import numpy as np
+import os
+import time
+from rof import Reservoir, WaterBalance, RofService
+
+# Answers the weekly operational question "given the current storage and this
+# week's demand forecast, what is the ROF?" without generating a ROF table.
+# The ROF is simulated against the same historical hydrology as
+# rof_table_generator.py, for the storage itself (exact) or for the storage
+# tier at or above it.
+
+def main():
+    start = time.perf_counter()
+
+    # Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
+    # Modify filenames and locations depending on test case ############
+    cwd = os.getcwd()
+    water_balance_path = cwd + "/water_balance_files/"
+
+    # To modify #########################################################
+    N_rofs = 50     # Number of ROF simulations, as in rof_table_generator.py
+    week = 0        # week of the query (week 0 is the first week of the policy simulation)
+    storage_frac = [1.0, 0.62, 0.4]   # current storage as fractions of full capacity
+    r = 0           # realization whose demand is used as this week's forecast
+    exact = True    # simulate the storage itself instead of the tier at or above it
+
+    water_balance = WaterBalance.load(water_balance_path)
+    reservoir = Reservoir()
+    service = RofService.from_water_balance(water_balance, reservoir, N_rofs)
+
+    # the forecast of the next year of demand, as the ROF table of week w reads it
+    demand_year = np.asarray(water_balance.demand[r, week:week + water_balance.n_weeks])
+    storage = np.asarray(storage_frac)*reservoir.capacity
+    rof = service.rof(storage, week, demand_year, exact=exact)
+    for frac, rof_q in zip(storage_frac, rof):
+        print(f"week {week}, storage {frac:.0%} of capacity: ROF = {rof_q:.2f}")
+
+    end = time.perf_counter()
+    print(f"Time = {end - start:0.4f} seconds")
+
+if __name__ == "__main__":
+    main()
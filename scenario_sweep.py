@@ -0,0 +1,52 @@
+import numpy as np
+import os
+import time
+from rof import (Reservoir, WaterBalance, load_tables, utility, set_backend, grid_scenarios,
+                 latin_hypercube_scenarios, run_sweep, save_sweep)
+
+# Simulates the restriction policy for many variants of the initial storage
+# tier, the ROF trigger alpha, the restriction multiplier and the restriction
+# duration, and writes the reliability and restriction frequency of every
+# variant to one table (scenario_sweep.csv).
+
+def main():
+    start = time.perf_counter()
+
+    # Get cwd code thanks to https://thispointer.com/python-how-to-get-the-current-working-directory/
+    # Modify filenames and locations depending on test case ############
+    cwd = os.getcwd()
+    water_balance_path = cwd + "/water_balance_files/"
+
+    # To modify #########################################################
+    N_reals = 100  # number of realizations
+    N_workers = os.cpu_count()  # Number of worker processes (1 runs serially)
+    backend = "numpy"   # "jit" uses the Numba-compiled loops if numba is installed
+    sampling = "grid"   # "grid" or "lhs" (Latin hypercube)
+    # grid of policy variants
+    tier_vec = [0.6, 0.8, 1.0]
+    alpha_vec = np.arange(0.00, 0.21, 0.01)
+    restr_factor_vec = [0.7, 0.8, 0.9]
+    restr_weeks_vec = [2, 4, 8]
+    # number of Latin hypercube samples over the ranges of rof.sweep
+    N_samples = 1000
+
+    # Load the scaled inputs and the ROF tables once for every scenario ###
+    water_balance = WaterBalance.load(water_balance_path)
+    reservoir = Reservoir()
+    set_backend(backend)
+    rof_tables = load_tables(cwd + "/rof_tables/", utility, N_reals)
+
+    if sampling == "grid":
+        scenarios = grid_scenarios(tier_vec, alpha_vec, restr_factor_vec, restr_weeks_vec)
+    else:
+        scenarios = latin_hypercube_scenarios(N_samples)
+    print(len(scenarios), " scenarios")
+
+    results = run_sweep(water_balance, rof_tables, reservoir, scenarios, n_workers=N_workers)
+    save_sweep("scenario_sweep.csv", results)
+
+    end = time.perf_counter()
+    print(f"Time = {end - start:0.4f} seconds")
+
+if __name__ == "__main__":
+    main()
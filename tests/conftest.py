@@ -0,0 +1,13 @@
+import pytest
+from rof import set_backend, get_backend
+from rof.kernels import HAVE_NUMBA
+
+# Runs a test once per backend, restoring the selected backend afterwards
+@pytest.fixture(params=["numpy", "jit"])
+def backend(request):
+    if request.param == "jit" and not HAVE_NUMBA:
+        pytest.skip("numba is not installed")
+    previous = get_backend()
+    set_backend(request.param)
+    yield request.param
+    set_backend(previous)
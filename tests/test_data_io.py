@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from rof import (Reservoir, WaterBalance, DynamicsWriter, load_dynamics, simulate_policy,
+                 simulate_policy_chunked)
+from rof.synthetic import (synthetic_demand, synthetic_evap, synthetic_inflows,
+                           synthetic_rof_tables)
+
+# Every alpha of a fine grid must be written to, and read back from, its own files
+
+def test_fine_alpha_grid_round_trip(tmp_path):
+    N_reals, n_years = 3, 3
+    water_balance = WaterBalance(synthetic_evap(N_reals), synthetic_inflows(N_reals),
+                                 synthetic_demand(N_reals, n_years))
+    rof_tables = synthetic_rof_tables(N_reals, water_balance.demand.shape[1] - water_balance.n_weeks,
+                                      N_rofs=1000)
+    alphas = np.arange(0, 0.03, 0.001)
+    reservoir = Reservoir()
+
+    simulate_policy_chunked(water_balance, rof_tables, alphas, 1.0, reservoir, block_size=2,
+                            dynamics_path=str(tmp_path))
+    expected = simulate_policy(water_balance, rof_tables, alphas, 1.0, reservoir,
+                               return_dynamics=True)[2:]
+    for kind, data in zip(DynamicsWriter.kinds, expected):
+        for a, alpha in enumerate(alphas):
+            assert np.array_equal(load_dynamics(str(tmp_path), kind, 1.0, alpha), data[a])
+
+def test_writer_rejects_alphas_with_the_same_files(tmp_path):
+    with pytest.raises(ValueError):
+        DynamicsWriter(str(tmp_path), 1.0, [0.01, 0.01 + 1e-12], 2, 10)
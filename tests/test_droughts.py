@@ -0,0 +1,99 @@
+import numpy as np
+from rof import calc_ssi6, Ssi6Tracker, drought_events, realization_events
+from rof.synthetic import synthetic_inflows, synthetic_ssi6
+
+# drought_events must find the same events as the original window-by-window
+# scan of storage_dynamics.py, kept here as the reference
+
+def meets_conditions(window):
+    three_month = True
+    hits_negative = False
+    for i in range(len(window)):
+        if window[i] > 0:
+            three_month = False
+            break
+    for i in range(len(window)):
+        if window[i] <= -1:
+            hits_negative = True
+            break
+    if (three_month + hits_negative == 2):
+        return 1
+    else:
+        return 0
+
+def find_droughts(realization):
+    droughts = []
+    for i in range(len(realization) - 12):
+        window = realization[i: i+12]
+        if meets_conditions(window) == 1:
+            info = {}
+            info['start'] = i
+            info['end'] = i + 11
+            info['severity'] = np.sum(window)
+            droughts.append(info)
+    return droughts
+
+def test_drought_events_match_find_droughts():
+    ssi6 = synthetic_ssi6(5, 600)
+    events = drought_events(ssi6)
+    assert len(events) > 0
+    for r in range(len(ssi6)):
+        expected = find_droughts(ssi6[r])
+        found = realization_events(events, r)
+        assert len(found) == len(expected)
+        for event, drought in zip(found, expected):
+            assert (event['start'], event['end']) == (drought['start'], drought['end'])
+            assert event['severity'] == drought['severity']
+
+# calc_ssi6 must match the pandas pipeline it replaces, written out here as
+# loops: pad-fill the log inflows, standardize them, take the rolling(24,
+# min_periods=1) mean and pad-fill it
+
+def reference_ssi6(inflows):
+    with np.errstate(invalid="ignore"):
+        x = np.log(inflows)
+    for i in range(1, len(x)):
+        if np.isnan(x[i]):
+            x[i] = x[i-1]
+    z = (x - np.nanmean(x))/np.nanstd(x, ddof=1)
+    ssi6 = np.full(len(z), np.nan)
+    for i in range(len(z)):
+        window = z[max(i - 23, 0):i+1]
+        window = window[~np.isnan(window)]
+        if len(window) > 0:
+            ssi6[i] = window.mean()
+    for i in range(1, len(ssi6)):
+        if np.isnan(ssi6[i]):
+            ssi6[i] = ssi6[i-1]
+    return ssi6
+
+# inflows with negative weeks, including leading ones, so that the forward
+# fills are exercised
+def inflows_with_gaps():
+    inflows = synthetic_inflows(4, n_years=4)
+    rng = np.random.default_rng(5)
+    inflows[rng.random(inflows.shape) < 0.05] *= -1
+    inflows[1, :3] = -1.0
+    return inflows
+
+def test_calc_ssi6_matches_pandas_pipeline():
+    inflows = inflows_with_gaps()
+    ssi6 = calc_ssi6(inflows)
+    for r in range(len(inflows)):
+        expected = reference_ssi6(inflows[r])
+        assert np.allclose(ssi6[r], expected, rtol=0, atol=1e-12, equal_nan=True)
+        assert np.allclose(calc_ssi6(inflows[r]), expected, rtol=0, atol=1e-12, equal_nan=True)
+
+def test_ssi6_tracker_matches_calc_ssi6():
+    inflows = inflows_with_gaps()
+    tracker = Ssi6Tracker(len(inflows))
+    w = 0
+    for n in (1, 5, 30, 1, 23, 24, 100):
+        tracker.update(inflows[:, w:w+n])
+        w += n
+    tracker.update(inflows[:, w])   # one week
+    tracker.update(inflows[:, w+1:])
+    expected = calc_ssi6(inflows)
+    assert tracker.n_weeks == inflows.shape[1]
+    assert np.allclose(tracker.values(), expected, rtol=0, atol=1e-12, equal_nan=True)
+    assert np.allclose(tracker.latest(), expected[:, -1], rtol=0, atol=1e-12, equal_nan=True)
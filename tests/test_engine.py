@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from rof import Reservoir, rof_table, rof_table_scalar, n_weeks, set_backend, instrument
+from rof.synthetic import synthetic_demand, synthetic_evap, synthetic_inflows
+
+# rof_table must reproduce the reference loops of rof_table_scalar bit for bit
+
+n_hist_years = 5
+tiers = np.linspace(0.0, 1.0, 11)
+
+@pytest.fixture(scope="module")
+def hydrology():
+    demand_r = synthetic_demand(1, n_years=2)[0]
+    return demand_r, synthetic_evap(1, n_years=8)[0], synthetic_inflows(1, n_years=8)[0]
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_rof_table_matches_scalar(hydrology, backend, adaptive):
+    demand_r, evap_timeseries, inflow_timeseries = hydrology
+    reservoir = Reservoir()
+    expected = rof_table_scalar(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                                reservoir, n_hist_years, n_weeks)
+    table = rof_table(demand_r, evap_timeseries, inflow_timeseries, tiers,
+                      reservoir, n_hist_years, n_weeks, adaptive=adaptive)
+    assert np.array_equal(table, expected)
+
+# Every backend must report the same counters for the same table: one
+# calc_storage per storage update up to the first failure of each ROF
+# simulation, as rof_table_scalar does
+
+class CountingReservoir(Reservoir):
+    calls = 0
+
+    def calc_storage(self, *args):
+        CountingReservoir.calls += 1
+        return super().calc_storage(*args)
+
+def table_counters(hydrology, adaptive):
+    instrument.reset()
+    rof_table(*hydrology, tiers, Reservoir(), n_hist_years, n_weeks, adaptive=adaptive)
+    return {name: instrument.counters.get(name, 0) for name in ("rof_simulations", "calc_storage")}
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_counters_match_across_backends(hydrology, backend, adaptive, monkeypatch):
+    monkeypatch.setenv("ROF_INSTRUMENT", "1")
+    instrument.enable()
+    try:
+        counters = table_counters(hydrology, adaptive)
+        set_backend("numpy")
+        expected = table_counters(hydrology, adaptive)
+        set_backend(backend)
+    finally:
+        instrument.enable(False)
+        instrument.reset()
+    if not adaptive:
+        CountingReservoir.calls = 0
+        rof_table_scalar(*hydrology, tiers, CountingReservoir(), n_hist_years, n_weeks)
+        assert expected["calc_storage"] == CountingReservoir.calls
+    assert counters == expected
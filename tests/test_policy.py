@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from rof import (Reservoir, WaterBalance, DynamicsWriter, load_dynamics, simulate_policy,
+                 simulate_policy_chunked, simulate_realization)
+from rof.synthetic import (synthetic_demand, synthetic_evap, synthetic_inflows,
+                           synthetic_rof_tables)
+
+# simulate_policy must reproduce the reference loop of simulate_realization
+# for every realization and alpha
+
+def test_simulate_policy_matches_realization(backend):
+    N_reals, n_years = 4, 3
+    water_balance = WaterBalance(synthetic_evap(N_reals), synthetic_inflows(N_reals),
+                                 synthetic_demand(N_reals, n_years))
+    demand_r, inflow_r, evap_r = water_balance.policy_inputs()
+    rof_tables = synthetic_rof_tables(N_reals, demand_r.shape[1])
+    alphas = np.array([0.0, 0.02, 0.1])
+    reservoir = Reservoir()
+
+    reliability, rf_avg, *dynamics = simulate_policy(water_balance, rof_tables, alphas, 1.0,
+                                                     reservoir, return_dynamics=True)
+    for a, alpha in enumerate(alphas):
+        for r in range(N_reals):
+            expected = simulate_realization(demand_r[r], inflow_r[r], evap_r[r], rof_tables[r],
+                                            alpha, 1.0, reservoir)
+            for x, expected_x in zip(dynamics, expected):
+                assert np.array_equal(x[a, r], expected_x)
+
+# simulate_policy_chunked must give the reliability and restriction frequency
+# of simulate_policy, and the dynamics it writes block by block must read back
+# through load_dynamics: exactly for "npy" and "csv", and to the precision of
+# the encoding for "compact"
+
+@pytest.mark.parametrize("output_format", ["npy", "csv", "compact"])
+def test_chunked_policy_matches_policy(tmp_path, output_format):
+    N_reals, n_years = 5, 3
+    water_balance = WaterBalance(synthetic_evap(N_reals), synthetic_inflows(N_reals),
+                                 synthetic_demand(N_reals, n_years))
+    demand_r = water_balance.policy_inputs()[0]
+    rof_tables = synthetic_rof_tables(N_reals, demand_r.shape[1])
+    alphas = np.array([0.0, 0.02, 0.1])
+    reservoir = Reservoir()
+
+    tier = 0.2   # low enough for some realizations to fail
+    reliability, rf_avg, *dynamics = simulate_policy(water_balance, rof_tables, alphas, tier,
+                                                     reservoir, return_dynamics=True)
+    chunked = simulate_policy_chunked(water_balance, rof_tables, alphas, tier, reservoir,
+                                      block_size=2, dynamics_path=str(tmp_path),
+                                      output_format=output_format)
+    assert np.array_equal(chunked[0], reliability)
+    assert np.array_equal(chunked[1], rf_avg)
+
+    for kind, data in zip(DynamicsWriter.kinds, dynamics):
+        for a, alpha in enumerate(alphas):
+            loaded = load_dynamics(str(tmp_path), kind, tier, alpha)
+            if output_format != "compact" or kind == "restr_freq":
+                assert np.array_equal(loaded, data[a])
+            elif kind == "short_term_risk":
+                assert np.allclose(loaded, data[a], rtol=0, atol=1e-5)
+            else:
+                assert np.array_equal(loaded, data[a].astype(np.float32))
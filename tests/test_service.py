@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from rof import Reservoir, RofService, rof_table, n_weeks
+from rof.synthetic import synthetic_demand, synthetic_evap, synthetic_inflows
+
+# RofService must give the entries of rof_table bit for bit at the tiers,
+# whether they are read from the tiers, simulated exactly or cached
+
+n_hist_years = 5
+tiers = np.linspace(0.0, 1.0, 11)
+
+@pytest.fixture(scope="module")
+def hydrology():
+    demand_r = synthetic_demand(1, n_years=2)[0]
+    evap_timeseries = synthetic_evap(1, n_years=8)[0]
+    inflow_timeseries = synthetic_inflows(1, n_years=8)[0]
+    table = rof_table(demand_r, evap_timeseries, inflow_timeseries, tiers, Reservoir(),
+                      n_hist_years, n_weeks)
+    return demand_r, evap_timeseries, inflow_timeseries, table
+
+def make_service(hydrology):
+    demand_r, evap_timeseries, inflow_timeseries, table = hydrology
+    return RofService(evap_timeseries, inflow_timeseries, Reservoir(), n_hist_years, tiers)
+
+@pytest.mark.parametrize("exact", [False, True])
+def test_rof_matches_table(hydrology, exact):
+    demand_r, _, _, table = hydrology
+    service = make_service(hydrology)
+    capacity = service.reservoir.capacity
+    for w in (0, 17, table.shape[1] - 1):
+        rof = service.rof(tiers*capacity, w, demand_r[w:w+n_weeks], exact=exact)
+        assert np.array_equal(rof, table[:, w])
+
+def test_batched_and_cached_queries_match_table(hydrology, monkeypatch):
+    demand_r, _, _, table = hydrology
+    service = make_service(hydrology)
+    rng = np.random.default_rng(0)
+    weeks = np.array([3, 40, 3, 0, 40, 3, 51, 0])
+    tier = rng.integers(0, len(tiers), len(weeks))
+    storage = tiers[tier]*service.reservoir.capacity
+    demand_years = np.stack([demand_r[w:w+n_weeks] for w in weeks])
+    expected = table[tier, weeks]
+
+    assert np.array_equal(service.rof(storage, weeks, demand_years, exact=True), expected)
+    assert np.array_equal(service.rof(storage, weeks, demand_years), expected)
+    assert service.rof(storage[1], weeks[1], demand_years[1]) == expected[1]
+
+    # every column is cached now, so nothing is simulated again
+    def not_cached(*args):
+        raise AssertionError("a cached column was simulated again")
+    monkeypatch.setattr(service, "_simulate_tiers", not_cached)
+    assert np.array_equal(service.rof(storage[::-1], weeks[::-1], demand_years[::-1]),
+                          expected[::-1])
@@ -0,0 +1,43 @@
+import numpy as np
+from rof import Reservoir, Utility, reservoir_capacity, simulate_policy, simulate_utilities
+from rof.synthetic import (synthetic_demand, synthetic_evap, synthetic_inflows,
+                           synthetic_rof_tables)
+
+# simulate_utilities must give each utility the results of simulate_policy on
+# its own allocation, with the capacity and threshold of every utility
+# broadcast against the stacked realizations
+
+N_reals, n_years = 4, 3
+alphas = np.array([0.0, 0.02, 0.1])
+tier = 0.3
+
+def check_utilities(utilities, evap, inflows, rof_tables):
+    reliability, rf_avg, *dynamics = simulate_utilities(utilities, evap, inflows, rof_tables,
+                                                        alphas, tier, return_dynamics=True)
+    for u, utility in enumerate(utilities):
+        expected = simulate_policy(utility.water_balance(evap, inflows), rof_tables[u], alphas,
+                                   tier, utility.reservoir, return_dynamics=True)
+        assert np.array_equal(reliability[u], expected[0])
+        assert np.array_equal(rf_avg[u], expected[1])
+        for x, expected_x in zip(dynamics, expected[2:]):
+            assert np.array_equal(x[u], expected_x)
+
+def test_single_utility_matches_policy(backend):
+    evap, inflows = synthetic_evap(N_reals), synthetic_inflows(N_reals)
+    utility = Utility("cary", synthetic_demand(N_reals, n_years), reservoir_capacity)
+    n_rof_weeks = utility.water_balance(evap, inflows).policy_inputs()[0].shape[1]
+    # an allocation of 1 is the whole reservoir, the default Reservoir()
+    assert repr(utility.reservoir) == repr(Reservoir())
+    check_utilities([utility], evap, inflows, [synthetic_rof_tables(N_reals, n_rof_weeks)])
+
+def test_utilities_match_separate_policies(backend):
+    evap, inflows = synthetic_evap(N_reals), synthetic_inflows(N_reals)
+    utilities = [Utility("cary", synthetic_demand(N_reals, n_years), reservoir_capacity, 0.5),
+                 Utility("durham", 0.5*synthetic_demand(N_reals, n_years, seed=5),
+                         0.3*reservoir_capacity, 0.3, threshold=0.25),
+                 Utility("owasa", 0.3*synthetic_demand(N_reals, n_years, seed=6),
+                         0.2*reservoir_capacity, 0.2, threshold=0.15)]
+    n_rof_weeks = utilities[0].water_balance(evap, inflows).policy_inputs()[0].shape[1]
+    rof_tables = [synthetic_rof_tables(N_reals, n_rof_weeks, seed=7 + u)
+                  for u in range(len(utilities))]
+    check_utilities(utilities, evap, inflows, rof_tables)